@@ -2,6 +2,7 @@ import pandas as pd
 import plotly.graph_objects as go
 import streamlit as st
 from HOVMOLLER_streamlit import * 
+from perfil_adcp import PerfilADCP
 from OPERACIONAL_UMI_SIMPLIFICADO import *
 from espelhadiretorio_FTP_SIG1000 import *
 import altair as alt
@@ -178,28 +179,8 @@ def reconstruir_json(df):
         novo_json[categoria][tipo_filtro][parametro][filtro] = valor
     return novo_json
 def wide_para_long_multivariaveis(df_wide):
-    df_wide['Time'] = pd.to_datetime(df_wide['GMT-03:00'])
-    df_wide['Dia'] = df_wide['Time'].dt.strftime('%Y-%m-%d')
-    df_wide['Hora'] = df_wide['Time'].dt.strftime('%H:%M')
-    var_cell_cols = [
-        col for col in df_wide.columns
-        if col not in ['Time', 'Dia', 'Hora'] and not col.startswith('Flag')]
-    data = []
-    for col in var_cell_cols:
-        m = re.match(r"(?P<variavel>.+)_Cell#(?P<cell_idx>\d+)", col)
-        if m:
-            variavel = m.group("variavel")
-            cell_idx = int(m.group("cell_idx"))
-            cell = f"Cell#{cell_idx}"
-            temp_df = df_wide[['Time', 'Dia', 'Hora', col]].copy()
-            temp_df = temp_df.rename(columns={col: 'Valor'})
-            temp_df['Cell'] = cell
-            temp_df['Variavel'] = variavel
-            temp_df['Cell_Index'] = cell_idx
-            data.append(temp_df)
-    df_long = pd.concat(data, ignore_index=True)
-    df_long = df_long[['Time', 'Dia', 'Hora', 'Cell', 'Cell_Index', 'Variavel', 'Valor']]
-    return df_long
+    # As colunas {variavel}_Cell#{n} viram o cubo do PerfilADCP uma vez; o formato longo sai dele
+    return PerfilADCP.de_wide(df_wide, "GMT-03:00").para_long()
 
 def criar_heatmap_temporal_altair(dataframe, eixo_x, eixo_y, valor, titulo, x_order=None, y_order=None, vmin=None, vmax=None):
     df_plot = dataframe.copy()
@@ -296,6 +277,9 @@ def processar_dados(df, opcao,df_matriz_qc):
             exibir_matriz_calor(df_matriz_qc,opcao)   
         if opcao=="CORRENTES":
             matriz_calor_correntes(df_matriz_qc,opcao)
+        if df.attrs.get("gaps"):
+            st.subheader("Trechos sem dados (gaps)")
+            st.dataframe(pd.DataFrame(df.attrs["gaps"]), use_container_width=True)
     with aba3:
         with open(json_path, 'r') as file:
             dados = json.load(file)        
@@ -350,7 +334,6 @@ def processar_dados(df, opcao,df_matriz_qc):
             dia_selecionado = st.selectbox("Selecione um dia", dias_ordenados)
             chart2 = heatmap_por_hora_no_dia_var(df_long, variavel_selecionada, dia_selecionado, cell_order)
             st.altair_chart(chart2, use_container_width=True)
-            df_wide.drop(columns=['Time', 'Dia', 'Hora'], inplace=True)
         else:
             st.info("Não há dados disponíveis no momento.")
     with aba6:
@@ -454,7 +437,7 @@ def home_page():
             st.rerun()
 @st.cache_data(show_spinner=True)
 def carregar_estacao(registro_id, caminho_config):
-    df, todos_os_resultados, lat, long, df_config = processar_sensor(
+    df, todos_os_resultados, lat, long, df_config = carregar_sensor(
         registro_id=registro_id,
         caminho_config=caminho_config
     )
@@ -3,6 +3,7 @@ import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 import streamlit as st
+from perfil_adcp import PerfilADCP
 
 # Configuração de página (uma vez, no topo)
 st.set_page_config(layout='wide')
@@ -25,49 +26,29 @@ def app_hovmoller(dados, time_col="GMT-03:00",
         Tipo de gráfico ('plot_simples', 'plot_flags').
     """
 
-    # Configurações internas
-    dados = dados.set_index(time_col)
-
     # Seleção pelo usuário, caso não passada
     if variavel_alvo is None:
         variavel_alvo = st.selectbox('Escolha a variável:', ['Amplitude', 'Speed', 'Direction'])
     if tipo_de_plot is None:
         tipo_de_plot = st.selectbox('Tipo de gráfico:', ['plot_simples', 'plot_flags'])
 
-    # Seleção de colunas
-    colunas_alvo = []
-    for coluna in dados.columns:
-        if 'Speed' in variavel_alvo:
-            if f'{variavel_alvo}(m/s)_Cell#' in coluna and f'Flag_{variavel_alvo}' not in coluna:
-                colunas_alvo.append(coluna)
-        else:
-            if f'{variavel_alvo}_Cell#' in coluna and f'Flag_{variavel_alvo}' not in coluna:
-                colunas_alvo.append(coluna)
-
-    dados_alvo = dados[colunas_alvo]
+    # Perfil (tempo x célula) da variável, sem procurar as colunas _Cell#N pelo nome a cada uso
+    perfil = PerfilADCP.de_wide(dados, time_col)
+    variavel = perfil.procurar_variavel(variavel_alvo)
+    dados_alvo = pd.DataFrame(perfil.variavel(variavel), index=perfil.tempos,
+                              columns=[f'{variavel}_Cell#{celula}' for celula in perfil.celulas])
     if 'Speed' in variavel_alvo:
         dados_alvo = dados_alvo[dados_alvo > -1.5].ffill().bfill()
 
-    # Flags
-    colunas_flag = [col for col in dados.columns if f'Flag_{variavel_alvo}' in col]
-    dados_flag = dados[colunas_flag]
-
-    # Coordenadas das flags
+    # Coordenadas das flags (tempo, índice da célula)
     profundidades = list(dados_alvo.columns)
     z = dados_alvo.transpose().interpolate(axis=1).ffill(axis=1).bfill(axis=1).values
 
-    x_flag3, y_flag3 = [], []
-    x_flag4, y_flag4 = [], []
-
-    for col_idx, col in enumerate(profundidades):
-        for row_idx, time in enumerate(dados_flag.index):
-            flag_value = dados_flag.iloc[row_idx, col_idx]
-            if flag_value == 3:
-                x_flag3.append(time)
-                y_flag3.append(col_idx)
-            elif flag_value == 4:
-                x_flag4.append(time)
-                y_flag4.append(col_idx)
+    flags = perfil.flags_variavel(variavel)
+    linhas3, celulas3 = np.nonzero(flags == 3)
+    linhas4, celulas4 = np.nonzero(flags == 4)
+    x_flag3, y_flag3 = list(perfil.tempos[linhas3]), list(celulas3)
+    x_flag4, y_flag4 = list(perfil.tempos[linhas4]), list(celulas4)
 
     # Eixo y invertido
     quantidade_de_profundidades = len(dados_alvo.columns)
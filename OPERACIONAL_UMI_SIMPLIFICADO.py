@@ -1,5 +1,5 @@
 import QC_FLAGS_UMISAN as qc
-import json
+import armazenamento_qc
 from api_hobo_meteo import acesso_API_HOBBO_meteo
 from api_hobo_mare import acesso_API_HOBBO_mare
 import pandas as pd
@@ -47,27 +47,32 @@ def processar_sensor(registro_id: int, caminho_config: str):
     b = qc.get_float(df_config, "b_sensor", 0.0)
     lat_estacao = qc.get_float(df_config, "lat_estacao", -22.0)
     long_estacao=qc.get_float(df_config, "long_estacao", -44.0)
+    # Execução do QC: "sequencial" (padrão), "threads" ou "processos"; 0 workers = todos os núcleos
+    modo_execucao_qc = qc.get_str(df_config, "modo_execucao_qc", "sequencial") or "sequencial"
+    n_workers_qc = qc.get_int(df_config, "n_workers_qc", 0) or None
+    # Trace JSON lines com tempo/memória de cada teste do QC (vazio = sem instrumentação)
+    arquivo_trace_qc = qc.get_path(df_config, "arquivo_trace_qc", None)
+    # Pasta do armazenamento Parquet do QC (vazio = não grava)
+    caminho_armazenamento_qc = qc.get_path(df_config, "caminho_armazenamento_qc", None)
+    # Tipos compactos (float32, category, Flag_ uint8) logo após a leitura, para reduzir a memória
+    tipos_compactos_qc = qc.get_bool(df_config, "tipos_compactos_qc")
     # --- Funções auxiliares ---
     def aplicar_filtros_padrao(df,filtros_ativos):
+        if tipos_compactos_qc:
+            df = qc.compactar_tipos(df, parameter_columns)
         return qc.aplicar_filtros(df, parameter_columns, dict_offset, limites_range_check, dict_max_min_test,
                                   st_time_series_dict, limite_repeticao_dados, limite_sigma_aceitavel_and_dict_delta_site,
                                   frequencia_sensor, config["time_col"], alert_window_size, dict_spike,
-                                  dict_lt_time_and_regressao, filtros_ativos, parametro_para_teste, parametros_direcionais)
+                                  dict_lt_time_and_regressao, filtros_ativos, parametro_para_teste, parametros_direcionais,
+                                  modo_execucao=modo_execucao_qc, n_workers=n_workers_qc, arquivo_trace=arquivo_trace_qc)
 
     def aplicar_filtros_correntes(df,filtros_ativos):
         return qc.aplicar_filtros(df, parameter_columns, dict_offset, limites_range_check, dict_max_min_test,
                                   st_time_series_dict, limite_repeticao_dados, limite_sigma_aceitavel_and_dict_delta_site,
                                   frequencia_sensor, config["time_col"], alert_window_size, dict_spike,
                                   dict_lt_time_and_regressao, filtros_ativos, parametro_para_teste, parametros_direcionais,
-                                  threshold_plato, threshold_mudanca_abrupta)
-
-    def expandir_chaves_para_celulas(dicionario, n=numero_de_celulas):
-        chaves_originais = list(dicionario.keys())
-        for k in chaves_originais:
-            if (("Amplitude_Cell" in k) or ("Speed(m/s)_Cell" in k) or ("Direction_Cell" in k)) and ("#" not in k):
-                for i in range(1, n + 1):
-                    dicionario[f"{k}#{i}"] = dicionario[k]
-                del dicionario[k]
+                                  threshold_plato, threshold_mudanca_abrupta,
+                                  modo_execucao=modo_execucao_qc, n_workers=n_workers_qc, arquivo_trace=arquivo_trace_qc)
 
     # --- Configuração do sensor ---
     def gerar_config_sensor(parameter_columns):
@@ -102,30 +107,25 @@ def processar_sensor(registro_id: int, caminho_config: str):
 
     config_sensor = {df_config["tipo_sensor"].iloc[0]: sensores_config[df_config["tipo_sensor"].iloc[0]]}
 
-    with open(caminho_dicionarios, 'r') as file:
-        config_data = json.load(file)
-
     todos_os_resultados = []
 
     for parametro_para_teste, config in config_sensor.items():
         parameter_columns = config["parameter_columns"]
 
-        for key in ["limites_range_check","dict_spike","limite_sigma_aceitavel_and_dict_delta_site",
-                    "limite_repeticao_dados","dict_lt_time_and_regressao","st_time_series_dict","dict_max_min_test"]:
-            expandir_chaves_para_celulas(config_data[parametro_para_teste][key])
-
-        limites_range_check = config_data[parametro_para_teste]["limites_range_check"]
-        dict_spike = config_data[parametro_para_teste]["dict_spike"]
-        limite_sigma_aceitavel_and_dict_delta_site = config_data[parametro_para_teste]["limite_sigma_aceitavel_and_dict_delta_site"]
-        limite_repeticao_dados = config_data[parametro_para_teste]["limite_repeticao_dados"]
-        dict_lt_time_and_regressao = config_data[parametro_para_teste]["dict_lt_time_and_regressao"]
-        st_time_series_dict = config_data[parametro_para_teste]["st_time_series_dict"]
-        dict_max_min_test = config_data[parametro_para_teste]["dict_max_min_test"]
+        # Limiares com as células expandidas, compilados uma vez por versão do dicionarios.json
+        perfil = qc.carregar_perfil_limiares(caminho_dicionarios, parametro_para_teste, numero_de_celulas)
+        limites_range_check = perfil["limites_range_check"]
+        dict_spike = perfil["dict_spike"]
+        limite_sigma_aceitavel_and_dict_delta_site = perfil["limite_sigma_aceitavel_and_dict_delta_site"]
+        limite_repeticao_dados = perfil["limite_repeticao_dados"]
+        dict_lt_time_and_regressao = perfil["dict_lt_time_and_regressao"]
+        st_time_series_dict = perfil["st_time_series_dict"]
+        dict_max_min_test = perfil["dict_max_min_test"]
         dict_offset = {"GMT-03:00": {"limite_futuro_segundos":600,"limite_passado_segundos":86400}}
 
         if parametro_para_teste == 'CORRENTES':
-            threshold_plato = config_data[parametro_para_teste]["threshold_plato"]
-            threshold_mudanca_abrupta = config_data[parametro_para_teste]["threshold_mudanca_abrupta"]
+            threshold_plato = perfil["threshold_plato"]
+            threshold_mudanca_abrupta = perfil["threshold_mudanca_abrupta"]
  
         # --- Processar dados ---
         if parametro_para_teste == 'METEOROLOGIA': 
@@ -141,7 +141,6 @@ def processar_sensor(registro_id: int, caminho_config: str):
                 print(f"Aviso: colunas ignoradas (não existem no df): {list(invalidas)}")
 
             # df = df.assign(**{f"Flag_{c}": 0 for c in validas})
-            df = df.assign(**{f"Flag_{col}": 0 for col in parameter_columns})
             df, resultados = aplicar_filtros_padrao(df, filtros_ativos)
  
         elif parametro_para_teste == 'MARE':
@@ -151,7 +150,6 @@ def processar_sensor(registro_id: int, caminho_config: str):
                 df, parameter_columns_mare = acesso_API_HOBBO_mare(parameter_columns, start=config["start"], logger_ids=config["logger_ids"])
 
             df = calibrar_sensores(df, config["height_col"], "Pressure_S2", a, b, reducao)
-            df = df.assign(**{f"Flag_{col}": 0 for col in parameter_columns})
             df, resultados = aplicar_filtros_padrao(df, filtros_ativos) 
             df = formatar_dados_temporais(df, config["time_col"], config["height_col"])
             df = processar_mare_com_redundancia(df, config["time_col"], config["height_col"], config["height_col"],
@@ -161,25 +159,50 @@ def processar_sensor(registro_id: int, caminho_config: str):
                                                 lat_estacao, config["fuso_horas"], ativar_preenchimento_gaps)
         elif parametro_para_teste == 'CORRENTES':
             dfs = organizar_dados_adcp(caminho_dos_dados, parameter_columns_correntes)
-            df = processar_correntes(dfs, parameter_columns_correntes)
-            df = df.assign(**{f"Flag_{col}": 0 for col in parameter_columns_correntes})
+            df = processar_correntes(dfs, parameter_columns_correntes, compactar=tipos_compactos_qc)
             df, resultados = aplicar_filtros_correntes(df, filtros_ativos)
         elif parametro_para_teste == 'ONDAS':
             dfs = organizar_dados_adcp(caminho_dos_dados, parameter_columns)
             df = processar_ondas(dfs)[parameter_columns]
-            df = df.assign(**{f"Flag_{col}": 0 for col in parameter_columns})
             df, resultados = aplicar_filtros_padrao(df, filtros_ativos)
         elif parametro_para_teste == 'ONDAS_NAO_DIRECIONAIS':
             df = pd.read_csv(caminho_dos_dados, header=1, sep=',', names=parameter_columns)
-            df = df.assign(**{f"Flag_{col}": 0 for col in parameter_columns})
             df, resultados = aplicar_filtros_padrao(df,filtros_ativos)
 
         df['GMT-03:00'] = pd.to_datetime(df['GMT-03:00'], errors='coerce')
         resultados["parameter_column"] = parametro_para_teste
         todos_os_resultados.append(resultados)
+        if caminho_armazenamento_qc:
+            armazenamento_qc.gravar_qc(caminho_armazenamento_qc, registro_id, parametro_para_teste, df, resultados)
 
     todos_os_resultados = pd.concat(todos_os_resultados, ignore_index=True)
     return df, todos_os_resultados,lat_estacao,long_estacao,df_config
+
+def carregar_sensor(registro_id: int, caminho_config: str, inicio=None, fim=None):
+    """
+    Mesmo retorno de processar_sensor, mas lê do armazenamento Parquet quando o sensor tem
+    'caminho_armazenamento_qc' e o período já foi processado; senão roda o pipeline (que grava).
+    Sem 'fim', o período pedido vai até o último dado que a fonte já deve ter: agora menos o atraso da fonte
+    ('atraso_fonte_qc' em minutos ou, sem ele, o atraso visto na última gravação) e um intervalo de
+    amostragem. Se a fonte pode ter dado depois do que está gravado, o pipeline roda de novo.
+    """
+    df_config = pd.read_csv(caminho_config)
+    df_config = df_config[df_config["RegistroID"] == registro_id]
+    raiz = qc.get_path(df_config, "caminho_armazenamento_qc", None)
+    tipo_sensor = df_config["tipo_sensor"].iloc[0]
+    fim_coberto = fim
+    if fim_coberto is None and raiz:
+        atraso = qc.get_int(df_config, "atraso_fonte_qc", -1)
+        atraso = pd.Timedelta(minutes=atraso) if atraso >= 0 else \
+            armazenamento_qc.atraso_fonte(raiz, registro_id, tipo_sensor) or pd.Timedelta(0)
+        fim_coberto = pd.Timestamp.now() - atraso - pd.Timedelta(minutes=qc.get_int(df_config, "frequencia_sensor", 10))
+    if not raiz or not armazenamento_qc.periodo_processado(raiz, registro_id, tipo_sensor, inicio, fim_coberto):
+        return processar_sensor(registro_id, caminho_config)
+    df = armazenamento_qc.ler_qc(raiz, registro_id, tipo_sensor, inicio, fim)
+    resultados = armazenamento_qc.ler_resultados(raiz, registro_id, tipo_sensor)
+    resultados = resultados.drop(columns=["Processado Em", "Inicio", "Fim"], errors="ignore")
+    return (df, resultados, qc.get_float(df_config, "lat_estacao", -22.0),
+            qc.get_float(df_config, "long_estacao", -44.0), df_config)
 # df, todos_os_resultados,lat,long,df_config = processar_sensor(registro_id=8, caminho_config=r"C:\Users\campo\Desktop\SistamaQAQC\DASH\f_configSensores.csv")
 # df, todos_os_resultados,lat,long,df_config = processar_sensor(registro_id=1, caminho_config=r"C:\Users\campo\Desktop\SistamaQAQC\DASH\f_configSensores.csv")
 
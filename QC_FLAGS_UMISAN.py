@@ -7,6 +7,19 @@ import re
 from io import StringIO
 import logging 
 import os
+import pickle
+import json
+import shutil
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from array import array
+from perfil_adcp import mapa_celulas
+import pyarrow as pa
+import pyarrow.parquet as pq
 def format_datetime(date_str, time_str):
     """Função para formatar a data e hora no formato correto (YYYY-MM-DD HH:MM:SS)."""
     try:
@@ -39,89 +52,124 @@ def aplicar_filtros(
     # Parâmetros opcionais
     threshold_plato=None, 
     threshold_mudanca_abrupta=None,
-
+    modo_execucao="sequencial",
+    n_workers=None,
+    timestamp_inicial=None,
+    posicao_inicial=0,
+    instrumentar=False,
+    arquivo_trace=None,
 ):
     resultados = []
-
-    if filtros_ativos.get("F01_time_offset"):
-        df_before = df.copy()
-        df, func_name = time_offset(df, dict_offset)
-        print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-    if filtros_ativos.get("F02_range_check_sensors"):
-        df_before = df.copy()
-        df, func_name = range_check_sensors(df, limites_range_check, alert_window_size,parameter_columns)
-        print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-    if filtros_ativos.get("F03_range_check_env"):
-        df_before = df.copy()
-        df, func_name = range_check_enviroment(df, limites_range_check, alert_window_size,parameter_columns)
-        print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-    if filtros_ativos.get("F04_gaps"):
-        df_before = df.copy()
-        df, func_name = identificar_gaps(df, sampling_frequency, parameter_columns, coluna_tempo, alert_window_size)
-        print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-    if filtros_ativos.get("F05_nulos"):
-        df_before = df.copy()
-        df, func_name = identificar_dados_nulos(df, parameter_columns, alert_window_size)
-        print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-    if filtros_ativos.get("F06_spike"):
-        df_before = df.copy()
-        df, func_name = spike_test(df, dict_spike, alert_window_size, parametros_direcionais)
-        print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-    if filtros_ativos.get("F07_lt_trend"):
-        df_before = df.copy()
-        df, func_name = lt_time_series_rate_of_change(df, dict_lt_time_and_regressao, alert_window_size, parametros_direcionais)
-        print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-    if filtros_ativos.get("F08_tempo_continuidade"):
-        df_before = df.copy()
-        df, func_name = teste_continuidade_tempo(df, limite_sigma_aceitavel_and_dict_delta_site, alert_window_size, parametros_direcionais)
-        print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-    if filtros_ativos.get("F09_duplicatas"):
-        df_before = df.copy()
-        df, func_name = identificar_duplicatas_tempo(df, parameter_columns, alert_window_size)
-        print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-    if filtros_ativos.get("F10_repetidos"):
-        df_before = df.copy()
-        df, func_name = verifica_dados_repetidos(df, limite_repeticao_dados, alert_window_size,parameter_columns)
-        print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-    if filtros_ativos.get("F11_st_segment"):
-        df_before = df.copy()
-        df, func_name = st_time_series_segment_shift(df, st_time_series_dict, alert_window_size, parametros_direcionais)
-        print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-    if filtros_ativos.get("F12_max_min"):
-        df_before = df.copy()
-        df, func_name = max_min_test(df, dict_max_min_test, parametros_direcionais)
-        print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-    if parametro_para_teste == "METEOROLOGIA":
-        if filtros_ativos.get("F13_temp_vs_dew"):
-            df_before = df.copy()
-            df, func_name = verificar_temperatura_vs_ponto_de_orvalho(df, alert_window_size)
-            print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-        if filtros_ativos.get("F14_vel_vs_rajada"):
-            df_before = df.copy()
-            df, func_name = verificar_velocidade_vs_rajada(df, alert_window_size)
-            print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-    if parametro_para_teste in ["ONDAS", "ONDAS_NAO_DIRECIONAIS"]:
-        if filtros_ativos.get("F15_altura_max_vs_sig"):
-            df_before = df.copy()
-            hs_col = 'Hm0' if parametro_para_teste == 'ONDAS' else 'HS_256Hz'
-            hmax_col = 'Hmax' if parametro_para_teste == 'ONDAS' else 'Hmax_calc_256Hz'
-            df, func_name = verificar_altura_max_vs_sig(df, Hs=hs_col, Hmax=hmax_col)
-            print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-    if parametro_para_teste == "CORRENTES":
-        if filtros_ativos.get("F16_grad_sinal"):
-            df_before = df.copy()
-            df, func_name = gradiente_de_amplitude_do_sinal(df)
-            print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-        if filtros_ativos.get("F17_platos"):
-            df_before = df.copy()
-            df, func_name = detectar_platos(df, threshold_plato, categorias=["amplitude", "speed", "direction"])
-            print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
-        if filtros_ativos.get("F18_mudanca_vert"):
-            df_before = df.copy()
-            df, func_name = taxa_de_mudanca_vertical(df, threshold_mudanca_abrupta, categorias=["amplitude", "speed", "direction"])
-            print_confiaveis(df_before, df, func_name, parameter_columns, resultados)
+    # df vindo de compactar_tipos: as colunas convertidas aqui também ficam em float32
+    memoria = df.attrs.get("memoria")
+    # As flags ficam numa matriz uint8 durante o QC e só voltam ao df como colunas Flag_ no fim
+    flags = MatrizFlags.de_dataframe(df, parameter_columns)
+    df = df.drop(columns=[f'Flag_{coluna}' for coluna in flags.colunas], errors='ignore')
+    # Conversão numérica feita uma vez aqui; os testes recebem as colunas já tipadas
+    df, falhas_conversao = tipar_colunas(df, parameter_columns, coluna_tempo, compacto=memoria is not None)
+    hs_col, hmax_col = COLUNAS_ALTURA.get(parametro_para_teste, (None, None))
+    entradas = {
+        "parameter_columns": parameter_columns,
+        "dict_offset": dict_offset,
+        "limites_range_check": limites_range_check,
+        "dict_max_min_test": dict_max_min_test,
+        "st_time_series_dict": st_time_series_dict,
+        "limite_repeticao_dados": limite_repeticao_dados,
+        "limite_sigma_aceitavel_and_dict_delta_site": limite_sigma_aceitavel_and_dict_delta_site,
+        "sampling_frequency": sampling_frequency,
+        "coluna_tempo": coluna_tempo,
+        "alert_window_size": alert_window_size,
+        "dict_spike": dict_spike,
+        "dict_lt_time_and_regressao": dict_lt_time_and_regressao,
+        "parametros_direcionais": parametros_direcionais,
+        "threshold_plato": threshold_plato,
+        "threshold_mudanca_abrupta": threshold_mudanca_abrupta,
+        "Hs": hs_col,
+        "Hmax": hmax_col,
+        "categorias_perfil": ["amplitude", "speed", "direction"],
+        "timestamp_inicial": timestamp_inicial,
+        "posicao_inicial": posicao_inicial,
+    }
+    plano = planejar_testes(filtros_ativos, parametro_para_teste, entradas)
+    # Estatísticas móveis e diferenças pedidas por mais de um teste ficam guardadas durante a execução
+    cache = CacheEstatisticas(chaves_reaproveitadas(plano))
+    livro = LivroDeFlags(df, flags, parameter_columns, cache)
+    # Custo de cada teste (tempo, memória, chamadas de alerta); desligado não mede nada
+    instrumentacao = Instrumentacao(parametro_para_teste, arquivo_trace) if instrumentar or arquivo_trace else None
+    flags.instrumentacao = instrumentacao
+    # Testes por coluna podem rodar em paralelo (threads/processos); os de df inteiro seguem em sequência
+    executor = ExecutorQC(modo_execucao, n_workers, instrumentacao)
+    try:
+        for etapa in plano:
+            opcoes = {"estatisticas": cache} if etapa["pedidos"] else {}
+            with (instrumentacao.medir(len(df), etapa["codigo"]) if instrumentacao else nullcontext()):
+                if etapa["por_coluna"]:
+                    df, func_name = executor.por_coluna(etapa["funcao"], df, flags, *etapa["argumentos"], **opcoes)
+                else:
+                    df, func_name = etapa["funcao"](df, *etapa["argumentos"], flags=flags, **opcoes)
+            if etapa["reindexa"]:
+                cache.limpar()
+            livro.registrar(df, flags, func_name, resultados)
+    finally:
+        executor.encerrar()
+        if instrumentacao is not None:
+            instrumentacao.encerrar()
+    df = flags.materializar(df)
     df_resultados = pd.DataFrame(resultados)
+    # attrs só recebem listas de dicts: um DataFrame em attrs quebra concat/astype do pandas
+    df_resultados.attrs["conversao"] = falhas_conversao
+    if memoria is not None:
+        df.attrs["memoria"] = memoria
+    if flags.gaps is not None:
+        # Trechos sem dado do F04
+        df.attrs["gaps"] = df_resultados.attrs["gaps"] = flags.gaps.to_dict('records')
+    if instrumentacao is not None:
+        df_resultados.attrs["instrumentacao"] = instrumentacao.registros
     return df, df_resultados
+
+def planejar_testes(filtros_ativos, parametro_para_teste, entradas):
+    """
+    Monta a sequência de testes ativos para o tipo de sensor a partir de REGISTRO_TESTES.
+    Cada etapa lista as estatísticas (chaves de CacheEstatisticas) que o teste vai pedir.
+    """
+    plano = []
+    for codigo, teste in REGISTRO_TESTES.items():
+        if not filtros_ativos.get(codigo):
+            continue
+        if teste["tipos_sensor"] is not None and parametro_para_teste not in teste["tipos_sensor"]:
+            continue
+        pedidos = []
+        if teste["estatisticas"]:
+            tipo, nome_configuracao = teste["estatisticas"]
+            for coluna, params in entradas[nome_configuracao].items():
+                direcional = coluna in entradas["parametros_direcionais"]
+                if tipo == "moveis":
+                    pedidos.append(chave_moveis(coluna, params["window"], 1, direcional))
+                else:
+                    pedidos.append(chave_diferencas(coluna, direcional))
+        plano.append({
+            "codigo": codigo,
+            "funcao": teste["funcao"],
+            "argumentos": [entradas[nome] for nome in teste["entradas"]],
+            "por_coluna": teste["por_coluna"],
+            "reindexa": teste["reindexa"],
+            "pedidos": pedidos,
+        })
+    return plano
+
+def chaves_reaproveitadas(plano):
+    """Chaves pedidas por mais de um teste no mesmo trecho; um teste que reindexa o df (F04) fecha o trecho."""
+    reaproveitadas = set()
+    pedidos = {}
+    for etapa in plano:
+        for chave in set(etapa["pedidos"]):
+            pedidos[chave] = pedidos.get(chave, 0) + 1
+        if etapa["reindexa"]:
+            reaproveitadas.update(chave for chave, total in pedidos.items() if total > 1)
+            pedidos = {}
+    reaproveitadas.update(chave for chave, total in pedidos.items() if total > 1)
+    return reaproveitadas
+
 #%%MODULO FUNCOES DEPENDENTES QCS
 def import_df_meteo(caminho_arquivo, nomes_colunas):
     '''importa o arquivo csv bruto, e gera as colunas de controle de qualidade(flag), e coluna suspect(ainda nao aplicavel)'''
@@ -179,8 +227,11 @@ def classificar_porcentagem(percentual_flags):
         return 'Prioridade Alta'
     else:
         return 'Prioridade Urgente'
+# Arquivo dos alertas URGENTE; QC_ARQUIVO_ALERTAS (ou atribuir qc.ARQUIVO_ALERTAS) muda o destino.
+# delay=True: o arquivo só é criado quando algo é escrito, não ao importar o módulo.
+ARQUIVO_ALERTAS = os.environ.get("QC_ARQUIVO_ALERTAS", "alertas.log")
 logging.basicConfig(
-    filename='alertas.log',
+    handlers=[logging.FileHandler(ARQUIVO_ALERTAS, delay=True)],
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
@@ -205,32 +256,230 @@ def get_date(df, col, default=None, fmt="%Y-%m-%d %H:%M:%S"):
     return pd.to_datetime(val).strftime(fmt) if pd.notna(val) else default
 
 def get_path(df, col, default=""):
-    val = df.get(col, pd.Series([default])).iloc[0]
-    return os.path.normpath(val) if pd.notna(val) else default
-
-def alerta(alert_window_size, parameter_column, func_name, df):
-    classe_counts = {'Não classificado': 0, 'Prioridade Baixa': 0, 'Prioridade Media': 0, 'Prioridade Alta': 0, 'Prioridade Urgente': 0}
-    for i in range(len(df) - alert_window_size + 1):
-        flags_na_janela = df[f'Flag_{parameter_column}'].iloc[i:i+alert_window_size].sum()
-        percentual_flags = (flags_na_janela / alert_window_size) * 100
-        classe = classificar_porcentagem(percentual_flags)
-        classe_counts[classe] += 1       
-        if classe == 'Prioridade Urgente':
-            urgente = f'Alerta URGENTE. Conferir dados -{parameter_column}- {func_name}.ID:{i}:{i+alert_window_size}'
-            with open('alertas.log', 'a') as f:
-                f.write(urgente + '\n')
-    pass
-def print_confiaveis(df_before, df_after, func_name, parameter_columns, resultados):
-    for parameter_column in parameter_columns:
-        # Flags antes e depois
-        flag_before = df_before[f'Flag_{parameter_column}']
-        flag_after = df_after[f'Flag_{parameter_column}']
-        
-        # Novas falhas geradas neste teste: eram 0 e viraram ≠ 0
-        novas_falhas = (flag_before == 0) & (flag_after != 0)
-        fail = novas_falhas.sum()
-        
-        total_testado = len(df_before)
+    """Caminho normalizado da coluna; coluna ausente ou vazia devolve o default (normpath("") seria ".")."""
+    val = df.get(col, pd.Series([None])).iloc[0]
+    if pd.isna(val) or not str(val).strip():
+        return default
+    return os.path.normpath(str(val).strip())
+
+# Dicionários do dicionarios.json com limiares por coluna (os que têm chaves *_Cell a expandir)
+DICIONARIOS_POR_COLUNA = ["limites_range_check", "dict_spike", "limite_sigma_aceitavel_and_dict_delta_site",
+                          "limite_repeticao_dados", "dict_lt_time_and_regressao", "st_time_series_dict", "dict_max_min_test"]
+CATEGORIAS_CELULA = ("Amplitude_Cell", "Speed(m/s)_Cell", "Direction_Cell")
+_JSON_LIMIARES = {}
+_PERFIS_LIMIARES = {}
+
+def expandir_celulas(configuracao, numero_de_celulas):
+    """Cópia da configuração com cada chave *_Cell (sem '#') trocada pelas chaves _Cell#1.._Cell#n, no fim."""
+    expandida = {chave: valor for chave, valor in configuracao.items()
+                 if not (any(categoria in chave for categoria in CATEGORIAS_CELULA) and "#" not in chave)}
+    for chave, valor in configuracao.items():
+        if chave not in expandida:
+            for i in range(1, numero_de_celulas + 1):
+                expandida[f"{chave}#{i}"] = valor
+    return expandida
+
+def vetores_limiares(configuracao, campos, colunas=None):
+    """(colunas, matriz colunas x campos em float) dos limiares por coluna; NaN onde o campo não existe."""
+    colunas = list(configuracao) if colunas is None else [coluna for coluna in colunas if coluna in configuracao]
+    matriz = np.full((len(colunas), len(campos)), np.nan)
+    for i, coluna in enumerate(colunas):
+        for j, campo in enumerate(campos):
+            valor = configuracao[coluna].get(campo)
+            if valor is not None:
+                matriz[i, j] = valor
+    return colunas, matriz
+
+class PerfilLimiares:
+    """
+    Limiares de um tipo de sensor do dicionarios.json com as células já expandidas, sem alterar o JSON
+    carregado (que fica em cache e é compartilhado). perfil[nome] devolve o dicionário que aplicar_filtros
+    recebe; os testes montam os vetores por coluna (vetores_limiares) do recorte de colunas que recebem.
+    """
+    def __init__(self, configuracao, numero_de_celulas=0):
+        self.configuracao = {nome: expandir_celulas(valor, numero_de_celulas) if nome in DICIONARIOS_POR_COLUNA else valor
+                             for nome, valor in configuracao.items()}
+
+    def __getitem__(self, nome):
+        return self.configuracao[nome]
+
+    def __contains__(self, nome):
+        return nome in self.configuracao
+
+    def get(self, nome, padrao=None):
+        return self.configuracao.get(nome, padrao)
+
+def carregar_perfil_limiares(caminho_dicionarios, tipo_sensor, numero_de_celulas=0):
+    """PerfilLimiares do tipo de sensor; o arquivo só é relido e o perfil recompilado quando o mtime muda."""
+    caminho = os.path.abspath(caminho_dicionarios)
+    mtime = os.path.getmtime(caminho)
+    if _JSON_LIMIARES.get(caminho, (None,))[0] != mtime:
+        with open(caminho, 'r') as file:
+            _JSON_LIMIARES[caminho] = (mtime, json.load(file))
+    chave = (caminho, tipo_sensor, numero_de_celulas)
+    if _PERFIS_LIMIARES.get(chave, (None,))[0] != mtime:
+        _PERFIS_LIMIARES[chave] = (mtime, PerfilLimiares(_JSON_LIMIARES[caminho][1][tipo_sensor], numero_de_celulas))
+    return _PERFIS_LIMIARES[chave][1]
+
+CLASSES_ALERTA = ['Não classificado', 'Prioridade Baixa', 'Prioridade Media', 'Prioridade Alta', 'Prioridade Urgente']
+LIMITES_ALERTA = [5, 10, 25, 50]  # mesmos cortes de classificar_porcentagem
+
+def alerta(alert_window_size, parameter_column, func_name, flags):
+    # a função classifica todas as janelas móveis de uma vez (soma acumulada) e grava os trechos urgentes no log.
+    classe_counts = dict.fromkeys(CLASSES_ALERTA, 0)
+    if isinstance(flags, pd.DataFrame):
+        valores = pd.to_numeric(flags[f'Flag_{parameter_column}'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    elif parameter_column in flags:
+        valores = flags[parameter_column]
+    else:
+        valores = np.zeros(flags.n_linhas, dtype=np.uint8)
+    if isinstance(flags, MatrizFlags) and flags.instrumentacao is not None:
+        flags.instrumentacao.contar_alerta(parameter_column)
+    n_janelas = len(valores) - alert_window_size + 1
+    if n_janelas <= 0:
+        return classe_counts
+    acumulado = np.concatenate([[0.0], np.cumsum(valores, dtype=float)])
+    flags_na_janela = acumulado[alert_window_size:] - acumulado[:n_janelas]
+    percentual_flags = (flags_na_janela / alert_window_size) * 100
+    classes = np.digitize(percentual_flags, LIMITES_ALERTA)
+    for classe, total in zip(CLASSES_ALERTA, np.bincount(classes, minlength=len(CLASSES_ALERTA))):
+        classe_counts[classe] = int(total)
+
+    # Janelas urgentes consecutivas viram um único trecho [inicio:fim] no log
+    urgentes = np.concatenate([[False], classes == 4, [False]])
+    bordas = np.flatnonzero(np.diff(urgentes.astype(np.int8)))
+    inicios, fins = bordas[0::2], bordas[1::2] - 1
+    if len(inicios):
+        linhas = [f'Alerta URGENTE. Conferir dados -{parameter_column}- {func_name}.ID:{i}:{j + alert_window_size}\n'
+                  for i, j in zip(inicios, fins)]
+        with open(ARQUIVO_ALERTAS, 'a') as f:
+            f.write(''.join(linhas))
+    return classe_counts
+
+class MatrizFlags:
+    """
+    Flags do QC numa única matriz uint8 contígua (linhas x parâmetros).
+    flags[coluna] devolve uma view da coluna; as colunas Flag_ só são criadas no DataFrame
+    quando pedidas (materializar / para_dataframe), para os dashboards e a exportação CSV.
+    """
+    instrumentacao = None  # Instrumentacao da execução, quando ligada (conta as chamadas de alerta)
+    gaps = None  # trechos sem dado encontrados pelo identificar_gaps
+
+    def __init__(self, colunas, n_linhas, valores=None):
+        self.colunas = list(colunas)
+        self.posicao = {coluna: j for j, coluna in enumerate(self.colunas)}
+        if valores is None:
+            valores = np.zeros((n_linhas, len(self.colunas)), dtype=np.uint8, order='F')
+        self.valores = valores
+
+    @classmethod
+    def de_dataframe(cls, df, colunas):
+        """Cria a matriz a partir das colunas Flag_ já existentes no df (as ausentes começam em 0)."""
+        colunas = list(dict.fromkeys(colunas))
+        flags = cls(colunas, len(df))
+        for j, coluna in enumerate(colunas):
+            if f'Flag_{coluna}' in df.columns:
+                flags.valores[:, j] = pd.to_numeric(df[f'Flag_{coluna}'], errors='coerce').fillna(0).to_numpy()
+        return flags
+
+    @property
+    def n_linhas(self):
+        return self.valores.shape[0]
+
+    def __contains__(self, coluna):
+        return coluna in self.posicao
+
+    def __getitem__(self, coluna):
+        return self.valores[:, self.posicao[coluna]]
+
+    def coluna(self, coluna):
+        """View da coluna de flags, criando-a zerada se ainda não existir."""
+        if coluna not in self.posicao:
+            self.posicao[coluna] = len(self.colunas)
+            self.colunas.append(coluna)
+            nova = np.zeros((self.n_linhas, 1), dtype=np.uint8)
+            self.valores = np.asfortranarray(np.hstack([self.valores, nova]))
+        return self[coluna]
+
+    def marcar(self, coluna, condicao, valor=4):
+        """flag |= valor onde a condição é verdadeira (NaN conta como falso)."""
+        flag = self.coluna(coluna)
+        np.bitwise_or(flag, valor, out=flag, where=np.asarray(condicao, dtype=bool))
+
+    def marcar_varias(self, colunas, condicoes, valor=4):
+        """marcar() de várias colunas de uma vez; condicoes tem uma coluna por coluna de flag."""
+        for coluna in colunas:
+            self.coluna(coluna)
+        indices = [self.posicao[coluna] for coluna in colunas]
+        self.valores[:, indices] |= np.where(condicoes, np.uint8(valor), np.uint8(0))
+
+    def reindexar(self, posicoes):
+        """Reordena as linhas pelas posições antigas; posição -1 cria linha nova com flag 0."""
+        posicoes = np.asarray(posicoes)
+        valores = np.zeros((len(posicoes), len(self.colunas)), dtype=np.uint8, order='F')
+        existentes = posicoes >= 0
+        valores[existentes] = self.valores[posicoes[existentes]]
+        self.valores = valores
+
+    def copia(self, colunas=None):
+        colunas = self.colunas if colunas is None else colunas
+        return self.valores[:, [self.posicao[coluna] for coluna in colunas]]
+
+    def para_dataframe(self, index=None):
+        return pd.DataFrame(self.valores, index=index, columns=[f'Flag_{coluna}' for coluna in self.colunas])
+
+    def materializar(self, df):
+        """Devolve o df com as colunas Flag_ (uint8) da matriz, substituindo as que já existirem."""
+        df = df.drop(columns=[f'Flag_{coluna}' for coluna in self.colunas], errors='ignore')
+        return pd.concat([df, self.para_dataframe(df.index)], axis=1)
+
+def abrir_flags(df, flags, colunas):
+    """Usa a matriz recebida ou, em chamadas avulsas de um teste, monta uma a partir do df."""
+    if flags is not None:
+        return flags, False
+    existentes = [coluna[len('Flag_'):] for coluna in df.columns if str(coluna).startswith('Flag_')]
+    return MatrizFlags.de_dataframe(df, list(colunas) + existentes), True
+
+def fechar_flags(df, flags, avulso):
+    return flags.materializar(df) if avulso else df
+
+class LivroDeFlags:
+    """
+    Livro-razão das flags entre os testes: guarda apenas a matriz uint8 das flags
+    do último teste, em vez de uma cópia inteira do DataFrame antes de cada teste.
+    """
+    def __init__(self, df, flags, parameter_columns, cache=None):
+        self.parameter_columns = parameter_columns
+        self.index, self.flags = df.index, flags.copia(parameter_columns)
+        self.cache = cache
+        self.contagens = cache.contagens() if cache is not None else {}
+
+    def registrar(self, df, flags, func_name, resultados):
+        index, atuais = df.index, flags.copia(self.parameter_columns)
+        inicio = len(resultados)
+        print_confiaveis(self.index, self.flags, index, atuais, func_name, self.parameter_columns, resultados)
+        self.index, self.flags = index, atuais
+        if self.cache is not None:
+            # Acertos/falhas do cache de estatísticas deste teste, por parâmetro
+            contagens = self.cache.contagens()
+            for linha in resultados[inicio:]:
+                acertos, falhas = contagens.get(linha['Parametro'], (0, 0))
+                acertos_antes, falhas_antes = self.contagens.get(linha['Parametro'], (0, 0))
+                linha['Cache Acertos'] = acertos - acertos_antes
+                linha['Cache Falhas'] = falhas - falhas_antes
+            self.contagens = contagens
+        return resultados
+
+def print_confiaveis(index_antes, flags_antes, index_depois, flags_depois, func_name, parameter_columns, resultados):
+    total_testado = len(index_antes)
+    # Alinha pelas linhas em comum quando o teste reindexou o df (ex.: identificar_gaps)
+    if not index_antes.equals(index_depois):
+        comuns = index_antes.intersection(index_depois)
+        flags_antes = flags_antes[index_antes.get_indexer(comuns)]
+        flags_depois = flags_depois[index_depois.get_indexer(comuns)]
+    # Novas falhas geradas neste teste: eram 0 e viraram ≠ 0
+    novas_falhas = ((flags_antes == 0) & (flags_depois != 0)).sum(axis=0)
+    for parameter_column, fail in zip(parameter_columns, novas_falhas):
         confiaveis = total_testado - fail
         dados_confiaveis = round(100 * confiaveis / total_testado, 2)
 
@@ -247,6 +496,236 @@ def print_confiaveis(df_before, df_after, func_name, parameter_columns, resultad
         })
     return resultados
 
+class Instrumentacao:
+    """
+    Custo de uma execução do QC: para cada teste (e, no modo sequencial, para cada parâmetro dos
+    testes por coluna) guarda tempo, linhas, memória alocada e pico (tracemalloc) e chamadas de alerta.
+    Os registros vão em df_resultados.attrs["instrumentacao"] (pd.DataFrame(...) ou tabela() monta a
+    tabela); com arquivo_trace também são acrescentados ao arquivo, um JSON por linha.
+    Em processos, as chamadas de alerta dos workers não são contadas.
+    """
+    def __init__(self, parametro_para_teste=None, arquivo_trace=None):
+        self.parametro_para_teste = parametro_para_teste
+        self.arquivo_trace = arquivo_trace
+        self.registros = []
+        self.pilha = []
+        self.alertas = {}
+        self.trava = threading.Lock()
+        self.ligou_tracemalloc = not tracemalloc.is_tracing()
+        if self.ligou_tracemalloc:
+            tracemalloc.start()
+
+    def contar_alerta(self, parameter_column):
+        with self.trava:
+            self.alertas[parameter_column] = self.alertas.get(parameter_column, 0) + 1
+
+    @contextmanager
+    def medir(self, linhas, codigo=None, parametro=None):
+        """Mede o bloco; sem código, herda o do teste que está sendo medido."""
+        codigo = codigo or (self.pilha[-1]["codigo"] if self.pilha else None)
+        alertas = dict(self.alertas)
+        memoria, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        etapa = {"codigo": codigo, "pico": 0}
+        self.pilha.append(etapa)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            tempo = time.perf_counter() - inicio
+            atual, pico = tracemalloc.get_traced_memory()
+            # reset_peak dos blocos internos zera o pico: o do bloco é o maior entre ele e os internos
+            pico = max(pico, etapa["pico"])
+            self.pilha.pop()
+            if self.pilha:
+                self.pilha[-1]["pico"] = max(self.pilha[-1]["pico"], pico)
+            if parametro is None:
+                chamadas = sum(self.alertas.values()) - sum(alertas.values())
+            else:
+                chamadas = self.alertas.get(parametro, 0) - alertas.get(parametro, 0)
+            self.registros.append({
+                'Teste': codigo,
+                'Parametro': parametro,
+                'Linhas': linhas,
+                'Tempo (s)': tempo,
+                'Linhas/s': linhas / tempo if tempo > 0 else np.nan,
+                'Memoria Alocada (MB)': (atual - memoria) / 2**20,
+                'Pico Memoria (MB)': max(pico - memoria, 0) / 2**20,
+                'Chamadas Alerta': chamadas,
+            })
+
+    def tabela(self):
+        return pd.DataFrame(self.registros)
+
+    def encerrar(self):
+        if self.ligou_tracemalloc:
+            tracemalloc.stop()
+            self.ligou_tracemalloc = False
+        if self.arquivo_trace:
+            horario = datetime.now().isoformat()
+            with open(self.arquivo_trace, 'a') as f:
+                for registro in self.registros:
+                    f.write(json.dumps(dict(registro, Horario=horario, tipo_sensor=self.parametro_para_teste),
+                                       default=float) + '\n')
+
+def recortar_argumentos(argumentos, colunas):
+    """Corta dicionários de configuração e listas de colunas para as colunas da fatia."""
+    recortados = []
+    for argumento in argumentos:
+        if isinstance(argumento, dict):
+            argumento = {chave: valor for chave, valor in argumento.items() if chave in colunas}
+        elif isinstance(argumento, list):
+            argumento = [coluna for coluna in argumento if coluna in colunas]
+        recortados.append(argumento)
+    return recortados
+
+def compartilhar_colunas(df, colunas):
+    """
+    Copia as colunas numéricas (dtype numpy) do df, uma após a outra, para um bloco de memória compartilhada.
+    Devolve (memoria, {coluna: (dtype, offset)}); colunas de outros tipos não entram no bloco.
+    """
+    layout, tamanho = {}, 0
+    for coluna in dict.fromkeys(colunas):
+        dtype = df[coluna].dtype
+        if isinstance(dtype, np.dtype) and dtype.kind in 'fiub':
+            layout[coluna] = (dtype.str, tamanho)
+            tamanho += -(-len(df) * dtype.itemsize // 8) * 8  # offsets alinhados em 8 bytes
+    memoria = shared_memory.SharedMemory(create=True, size=max(tamanho, 1))
+    for coluna, (dtype, offset) in layout.items():
+        np.ndarray(len(df), dtype=dtype, buffer=memoria.buf, offset=offset)[:] = df[coluna].to_numpy()
+    return memoria, layout
+
+def _executar_fatia(funcao, df_fatia, argumentos, flags, opcoes, dados=None):
+    """
+    Roda um teste numa fatia de colunas. Em processos, flags = (nome, forma, inicio, fim, colunas) da memória
+    compartilhada e dados = (nome, colunas do df, {coluna: (dtype, offset)}) do bloco de colunas numéricas;
+    df_fatia traz só o índice e as colunas que não estão no bloco. Volta só o que o teste alterou.
+    """
+    if not isinstance(flags, tuple):
+        return funcao(df_fatia, *argumentos, flags=flags, **opcoes)[0]
+    nome, forma, inicio, fim, colunas = flags
+    nome_dados, colunas_df, layout = dados
+    memoria = shared_memory.SharedMemory(name=nome)
+    memoria_dados = shared_memory.SharedMemory(name=nome_dados)
+    try:
+        def original(coluna):
+            dtype, offset = layout[coluna]
+            return np.ndarray(forma[0], dtype=dtype, buffer=memoria_dados.buf, offset=offset)
+        entrada = pd.DataFrame({coluna: original(coluna).copy() if coluna in layout else df_fatia[coluna]
+                                for coluna in colunas_df}, index=df_fatia.index, copy=False)
+        valores = np.ndarray(forma, dtype=np.uint8, buffer=memoria.buf, order='F')
+        df_fatia = funcao(entrada, *argumentos, flags=MatrizFlags(colunas, forma[0], valores[:, inicio:fim]), **opcoes)[0]
+        del valores
+        alteradas = [coluna for coluna in df_fatia.columns
+                     if coluna not in layout or df_fatia[coluna].dtype != np.dtype(layout[coluna][0])
+                     or not np.array_equal(df_fatia[coluna].to_numpy(), original(coluna), equal_nan=True)]
+        df_fatia = df_fatia[alteradas]
+    finally:
+        memoria.close()
+        memoria_dados.close()
+    # O cache do processo é um recorte: volta para ser juntado ao principal
+    return df_fatia, opcoes.get("estatisticas")
+
+class ExecutorQC:
+    """
+    Executa os testes por coluna em sequência, em threads ou em processos.
+    As colunas da matriz de flags são divididas em blocos contíguos (um por worker); cada worker
+    recebe só as colunas de dados do seu bloco e escreve direto no seu bloco de flags
+    (view em threads, memória compartilhada em processos), então o resultado não depende da ordem.
+    Em processos as colunas numéricas também vão por memória compartilhada (compartilhar_colunas): o pickle
+    de cada tarefa leva só nomes, offsets, forma, o índice e as colunas não numéricas.
+    Em processos no Windows, o script que chama aplicar_filtros precisa do guard if __name__ == "__main__".
+    """
+    MODOS = ("sequencial", "threads", "processos")
+
+    def __init__(self, modo="sequencial", n_workers=None, instrumentacao=None):
+        if modo not in self.MODOS:
+            raise ValueError(f"modo_execucao deve ser um de {self.MODOS}, recebido: {modo!r}")
+        self.modo = modo
+        self.instrumentacao = instrumentacao
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.pool = None
+        if modo == "threads" and self.n_workers > 1:
+            self.pool = ThreadPoolExecutor(self.n_workers)
+        elif modo == "processos" and self.n_workers > 1:
+            self.pool = ProcessPoolExecutor(self.n_workers)
+
+    def encerrar(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def blocos(self, df, flags, n_blocos=None):
+        """Fatias [inicio, fim) contíguas da matriz de flags com as colunas presentes no df."""
+        posicoes = [j for j, coluna in enumerate(flags.colunas) if coluna in df.columns]
+        if not posicoes:
+            return []
+        return [(int(parte[0]), int(parte[-1]) + 1)
+                for parte in np.array_split(posicoes, min(n_blocos or self.n_workers, len(posicoes))) if len(parte)]
+
+    def _vista(self, flags, colunas, inicio, fim):
+        vista = MatrizFlags(colunas, flags.n_linhas, flags.valores[:, inicio:fim])
+        vista.instrumentacao = self.instrumentacao
+        return vista
+
+    def por_coluna(self, funcao, df, flags, *argumentos, **opcoes):
+        if self.pool is None and self.instrumentacao is None:
+            return funcao(df, *argumentos, flags=flags, **opcoes)
+        fatias = []
+        # Sequencial instrumentado: uma coluna por fatia, para medir cada parâmetro
+        for inicio, fim in self.blocos(df, flags, len(flags.colunas) if self.pool is None else None):
+            colunas = flags.colunas[inicio:fim]
+            fatias.append((inicio, fim, colunas, [coluna for coluna in colunas if coluna in df.columns],
+                           recortar_argumentos(argumentos, colunas)))
+
+        if self.pool is None:
+            retornos = []
+            for inicio, fim, colunas, colunas_df, args in fatias:
+                with self.instrumentacao.medir(len(df), parametro=colunas[0]):
+                    retornos.append(_executar_fatia(funcao, df[colunas_df], args, self._vista(flags, colunas, inicio, fim), opcoes))
+        elif self.modo == "threads":
+            futuros = [self.pool.submit(_executar_fatia, funcao, df[colunas_df], args,
+                                        self._vista(flags, colunas, inicio, fim), opcoes)
+                       for inicio, fim, colunas, colunas_df, args in fatias]
+            retornos = [futuro.result() for futuro in futuros]
+        else:
+            cache = opcoes.get("estatisticas")
+            memoria = shared_memory.SharedMemory(create=True, size=max(flags.valores.nbytes, 1))
+            memoria_dados, layout = compartilhar_colunas(df, [coluna for *_, colunas_df, _ in fatias for coluna in colunas_df])
+            try:
+                compartilhada = np.ndarray(flags.valores.shape, dtype=np.uint8, buffer=memoria.buf, order='F')
+                compartilhada[:] = flags.valores
+                futuros = [self.pool.submit(_executar_fatia, funcao,
+                                            df[[coluna for coluna in colunas_df if coluna not in layout]], args,
+                                            (memoria.name, flags.valores.shape, inicio, fim, colunas),
+                                            dict(opcoes, estatisticas=cache.recorte(colunas)) if cache is not None else opcoes,
+                                            (memoria_dados.name, colunas_df,
+                                             {coluna: layout[coluna] for coluna in colunas_df if coluna in layout}))
+                           for inicio, fim, colunas, colunas_df, args in fatias]
+                retornos = []
+                for futuro in futuros:
+                    df_fatia, recorte = futuro.result()
+                    retornos.append(df_fatia)
+                    if cache is not None:
+                        cache.juntar(recorte)
+                flags.valores[:] = compartilhada
+                del compartilhada
+            finally:
+                memoria.close()
+                memoria.unlink()
+                memoria_dados.close()
+                memoria_dados.unlink()
+
+        # Junta na ordem dos blocos: colunas convertidas pelos testes (to_numeric) voltam para o df
+        for df_fatia in retornos:
+            for coluna in df_fatia.columns:
+                df[coluna] = df_fatia[coluna]
+        # Colunas da configuração que ainda não têm flag rodam aqui, criando as flags na ordem de sempre
+        restantes = list(dict.fromkeys(chave for argumento in argumentos if isinstance(argumento, dict)
+                                       for chave in argumento if chave in df.columns and chave not in flags))
+        if restantes:
+            df, _ = funcao(df, *recortar_argumentos(argumentos, restantes), flags=flags, **opcoes)
+        return df, funcao.__name__
+
 def mean_direction(angles):
     # Calcula a média angular de uma lista de direções (em graus)
     radians = np.radians(angles)  # Converte para radianos
@@ -273,6 +752,242 @@ def circular_std(series):
     R = np.sqrt(np.mean(np.cos(radians))**2 + np.mean(np.sin(radians))**2)
     return np.rad2deg(np.sqrt(-2 * np.log(R))) if R > 0 else np.nan
 
+def _janelas_moveis(valores, window):
+    """Matriz (n, window) com a janela móvel que termina em cada linha (início completado com NaN)."""
+    preenchido = np.concatenate([np.full(window - 1, np.nan), valores])
+    return np.lib.stride_tricks.sliding_window_view(preenchido, window)
+
+def _soma_compacta(matriz, validos):
+    """
+    Soma por linha apenas dos valores válidos.
+    Os válidos são compactados à esquerda e somados em blocos de mesmo tamanho,
+    reproduzindo exatamente o arredondamento de np.mean(serie.dropna()).
+    """
+    contagem = validos.sum(axis=1)
+    if validos.all():
+        return np.ascontiguousarray(matriz).sum(axis=1), contagem
+    ordem = np.argsort(~validos, axis=1, kind='stable')
+    compacta = np.take_along_axis(matriz, ordem, axis=1)
+    soma = np.zeros(len(matriz))
+    for k in np.unique(contagem):
+        if k == 0:
+            continue
+        linhas = contagem == k
+        soma[linhas] = np.ascontiguousarray(compacta[linhas, :k]).sum(axis=1)
+    return soma, contagem
+
+ELEMENTOS_POR_BLOCO_JANELAS = 1 << 18  # linhas x window materializados de cada vez nas janelas móveis
+
+def estatisticas_circulares_moveis(serie, window, min_periods=1):
+    """
+    Média e desvio padrão circulares (graus) em janela móvel, sem rolling().apply.
+    Equivale a rolling(window, min_periods).apply(circular_mean/circular_std), ignorando NaN.
+    Seno e cosseno são calculados uma vez por amostra; as janelas (vistas) só são copiadas em blocos
+    de linhas, então a memória extra fica em ELEMENTOS_POR_BLOCO_JANELAS e não em n x window.
+    """
+    radianos = np.deg2rad(np.asarray(serie, dtype=float))
+    janelas_sin = _janelas_moveis(np.sin(radianos), window)
+    janelas_cos = _janelas_moveis(np.cos(radianos), window)
+    n = len(radianos)
+    soma_sin, soma_cos = np.zeros(n), np.zeros(n)
+    contagem = np.zeros(n, dtype=np.int64)
+    passo = max(ELEMENTOS_POR_BLOCO_JANELAS // window, 1)
+    for inicio in range(0, n, passo):
+        bloco = slice(inicio, inicio + passo)
+        validos = ~np.isnan(janelas_sin[bloco])
+        soma_sin[bloco], contagem[bloco] = _soma_compacta(janelas_sin[bloco], validos)
+        soma_cos[bloco], _ = _soma_compacta(janelas_cos[bloco], validos)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media_sin = soma_sin / contagem
+        media_cos = soma_cos / contagem
+        media = np.rad2deg(np.arctan2(media_sin, media_cos)) % 360
+        # float_power usa pow() como o escalar **2 de circular_std (o **2 vetorial usa x*x e arredonda diferente)
+        R = np.sqrt(np.float_power(media_cos, 2) + np.float_power(media_sin, 2))
+        desvio = np.where(R > 0, np.rad2deg(np.sqrt(-2 * np.log(R))), np.nan)
+    insuficiente = contagem < max(min_periods, 1)
+    media[insuficiente] = np.nan
+    desvio[insuficiente] = np.nan
+    return media, desvio
+
+def estatisticas_moveis(serie, window, direcional, estatisticas=None, min_periods=1):
+    """Média e desvio padrão móveis da série, circulares se direcional (via cache se houver)."""
+    if estatisticas is not None:
+        return estatisticas.moveis(serie, window, min_periods, direcional)
+    if direcional:
+        return estatisticas_circulares_moveis(serie, window, min_periods=min_periods)
+    movel = serie.rolling(window=window, min_periods=min_periods)
+    return movel.mean(), movel.std()
+
+def diferencas_absolutas(serie, direcional, estatisticas=None):
+    """|x[i] - x[i-1]| (menor diferença angular se direcional), via cache se houver."""
+    if estatisticas is not None:
+        return estatisticas.diferencas(serie, direcional)
+    if direcional:
+        return angular_diff(serie, serie.shift(1))
+    return serie.diff().abs()
+
+def chave_moveis(coluna, window, min_periods, direcional):
+    return ("moveis", coluna, window, min_periods, direcional)
+
+def chave_diferencas(coluna, direcional):
+    return ("diferencas", coluna, direcional)
+
+class CacheEstatisticas:
+    """
+    Memória das estatísticas de uma execução do QC, por (coluna, janela, min_periods, direcional)
+    para média/desvio móveis e por (coluna, direcional) para as diferenças consecutivas.
+    Só guarda as chaves em 'reaproveitadas' (None = todas); conta acertos e falhas por coluna.
+    limpar() descarta os valores quando as linhas do df mudam (reindexação).
+    """
+    def __init__(self, reaproveitadas=None):
+        self.reaproveitadas = reaproveitadas
+        self.valores = {}
+        self.acertos = {}
+        self.falhas = {}
+
+    def _buscar(self, chave, calcular):
+        coluna = chave[1]
+        if chave in self.valores:
+            self.acertos[coluna] = self.acertos.get(coluna, 0) + 1
+            return self.valores[chave]
+        self.falhas[coluna] = self.falhas.get(coluna, 0) + 1
+        resultado = calcular()
+        if self.reaproveitadas is None or chave in self.reaproveitadas:
+            self.valores[chave] = resultado
+        return resultado
+
+    def moveis(self, serie, window, min_periods=1, direcional=False):
+        return self._buscar(chave_moveis(serie.name, window, min_periods, direcional),
+                            lambda: estatisticas_moveis(serie, window, direcional, min_periods=min_periods))
+
+    def diferencas(self, serie, direcional=False):
+        return self._buscar(chave_diferencas(serie.name, direcional),
+                            lambda: diferencas_absolutas(serie, direcional))
+
+    def limpar(self):
+        self.valores = {}
+
+    def contagens(self):
+        """{coluna: (acertos, falhas)} acumulados."""
+        colunas = set(self.acertos) | set(self.falhas)
+        return {coluna: (self.acertos.get(coluna, 0), self.falhas.get(coluna, 0)) for coluna in colunas}
+
+    def recorte(self, colunas):
+        """Cópia só com os valores das colunas dadas e contagens zeradas (para enviar a outro processo)."""
+        recorte = CacheEstatisticas(self.reaproveitadas)
+        recorte.valores = {chave: valor for chave, valor in self.valores.items() if chave[1] in colunas}
+        return recorte
+
+    def juntar(self, outro):
+        """Incorpora valores e contagens de um recorte que voltou de outro processo."""
+        self.valores.update(outro.valores)
+        for coluna, (acertos, falhas) in outro.contagens().items():
+            self.acertos[coluna] = self.acertos.get(coluna, 0) + acertos
+            self.falhas[coluna] = self.falhas.get(coluna, 0) + falhas
+
+def comprimento_corridas(matriz, tolerancia=0):
+    """
+    Comprimento da corrida de valores constantes a que pertence cada linha, por coluna; NaN sempre quebra.
+    Sem tolerância, vizinhos iguais continuam a mesma corrida e tudo sai de uma única soma acumulada (O(n)).
+    Com tolerância, a corrida é a maior janela com amplitude (máximo - mínimo) <= tolerância que contém
+    a linha (_corridas_por_amplitude): uma rampa lenta não vira corrida só porque cada passo é pequeno.
+    """
+    matriz = np.asarray(matriz, dtype=float)
+    n_linhas, n_colunas = matriz.shape
+    tolerancia = np.broadcast_to(np.asarray(tolerancia, dtype=float), (n_colunas,))
+    with np.errstate(invalid='ignore'):
+        continua = np.abs(np.diff(matriz, axis=0)) <= 0
+    inicio = np.ones((n_linhas, n_colunas), dtype=bool)
+    inicio[1:] = ~continua
+    # Ordem 'F' enfileira coluna após coluna; a primeira linha de cada coluna sempre abre corrida
+    ids = np.cumsum(inicio.ravel(order='F'))
+    comprimentos = np.bincount(ids)[ids].reshape((n_linhas, n_colunas), order='F')
+    for j in np.flatnonzero(tolerancia > 0):
+        comprimentos[:, j] = _corridas_por_amplitude(matriz[:, j], tolerancia[j])
+    return comprimentos
+
+def _tabela_esparsa(valores, juntar):
+    """tabela[l][p] = juntar(valores[p:p + 2**l]) para cada nível l (máximo/mínimo de blocos de 2**l linhas)."""
+    tabela = [valores]
+    while 2 ** len(tabela) <= len(valores):
+        passo = 2 ** (len(tabela) - 1)
+        tabela.append(juntar(tabela[-1][:-passo], tabela[-1][passo:]))
+    return tabela
+
+def _corridas_por_amplitude(valores, tolerancia):
+    """
+    Para cada linha, o comprimento da maior janela de amplitude <= tolerância que a contém (uma coluna).
+    O início mais antigo da janela que termina em cada linha sai de um salto binário sobre tabelas esparsas
+    de máximo e mínimo, e o maior comprimento que cobre cada linha de uma consulta de máximo em intervalo:
+    O(n log n) vetorizado. Depende só das linhas vizinhas, como a corrida sem tolerância.
+    """
+    n = len(valores)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    maximos = _tabela_esparsa(valores, np.maximum)
+    minimos = _tabela_esparsa(valores, np.minimum)
+    linhas = np.arange(n)
+    inicio = linhas.copy()
+    maior, menor = valores.copy(), valores.copy()
+    for nivel in range(len(maximos) - 1, -1, -1):
+        candidato = inicio - 2 ** nivel
+        posicao = np.maximum(candidato, 0)
+        novo_maior = np.maximum(maior, maximos[nivel][posicao])
+        novo_menor = np.minimum(menor, minimos[nivel][posicao])
+        with np.errstate(invalid='ignore'):
+            estende = (candidato >= 0) & (novo_maior - novo_menor <= tolerancia)  # NaN na janela não estende
+        inicio = np.where(estende, candidato, inicio)
+        maior = np.where(estende, novo_maior, maior)
+        menor = np.where(estende, novo_menor, menor)
+    terminando = linhas - inicio + 1
+    # janelas que cobrem a linha i: as que terminam entre i e a última cujo início ainda é <= i
+    ultimo_fim = np.searchsorted(inicio, linhas, side='right') - 1
+    tamanho = ultimo_fim - linhas + 1
+    nivel = np.log2(tamanho).astype(int)
+    blocos = _tabela_esparsa(terminando, np.maximum)
+    comprimentos = np.empty(n, dtype=np.int64)
+    for l in np.unique(nivel):
+        sel = nivel == l
+        comprimentos[sel] = np.maximum(blocos[l][linhas[sel]], blocos[l][ultimo_fim[sel] - 2 ** l + 1])
+    return comprimentos
+
+def inicio_segmentos(m_points, posicao_inicial=0):
+    """Linhas antes do primeiro segmento completo quando a série começa na posição global 'posicao_inicial'."""
+    return -posicao_inicial % m_points
+
+def segmentos(valores, m_points, posicao_inicial=0):
+    """
+    Matriz (n_segmentos, m_points) com os segmentos completos da série; a sobra do fim fica de fora.
+    Os segmentos são contados desde a posição global 0 (posicao_inicial > 0 no modo incremental).
+    """
+    valores = np.asarray(valores, dtype=float)[inicio_segmentos(m_points, posicao_inicial):]
+    n_segments = len(valores) // m_points
+    return valores[:n_segments * m_points].reshape(n_segments, m_points)
+
+def media_segmentos(matriz, direcional=False):
+    """Média de cada segmento ignorando NaN (angular em graus, como mean_direction, se direcional)."""
+    validos = ~np.isnan(matriz)
+    if not direcional:
+        soma, contagem = _soma_compacta(matriz, validos)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return soma / contagem
+    radianos = np.radians(matriz)
+    soma_cos, contagem = _soma_compacta(np.cos(radianos), validos)
+    soma_sin, _ = _soma_compacta(np.sin(radianos), validos)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = np.degrees(np.arctan2(soma_sin / contagem, soma_cos / contagem))
+    return np.where(media < 0, media + 360, media)
+
+def amplitude_segmentos(matriz):
+    """max - min de cada segmento ignorando NaN (NaN se o segmento for todo NaN)."""
+    return np.fmax.reduce(matriz, axis=1) - np.fmin.reduce(matriz, axis=1)
+
+def segmentos_para_linhas(condicao, m_points, n_linhas, inicio=0):
+    """Espalha a condição de cada segmento para as suas linhas (np.repeat); o que fica fora dos segmentos é False."""
+    linhas = np.zeros(n_linhas, dtype=bool)
+    linhas[inicio:inicio + len(condicao) * m_points] = np.repeat(condicao, m_points)
+    return linhas
+
 def calculate_mean_A(df):
     """    Calcula a média das colunas A1, A2, A3 e A4 para cada instante de tempo (DateTime).    """
     columns_to_avg = ['Amplitude', 'A2', 'A3', 'A4']
@@ -338,53 +1053,304 @@ def process_txt_to_multiple_dfs(input_file_meteo):
     
     return dataframes
 
-def organizar_String_adcp(caminho_arquivo,parameter_columns_PNORC,parameter_columns_PNORI,parameter_columns_PNORS,parameter_columns_PNORB,parameter_columns_PNORW,parameter_columns ):
-    with open(caminho_arquivo, 'r', encoding='utf-8') as f:
-        linhas_arquivo = f.readlines()[0:]  # pula as 4 primeiras linhas
-        conteudo = ''.join(linhas_arquivo)
-    conteudo_io = StringIO(conteudo)
-    df = pd.read_csv(conteudo_io, sep=',', header=None,on_bad_lines='skip')
-    df_datalogger = df.iloc[:, [0, 2]]
-    df_datalogger.columns = ['GMT-03:00', 'Battery']  # novos nomes das colunas
-
-    df = pd.DataFrame(df.iloc[:, 3])
-    df_texto = df.to_string(index=False, header=False)
-    df_texto = df_texto.replace('\n', '')  # Substitui quebras de linha por espaço
-    df_texto = df_texto.replace('PNORI\n', 'PNORI')
-    df_texto = df_texto.replace('  ', '\n')
-    df_texto=df_texto.strip()
-    texto_io = StringIO(df_texto)
-    rows = []
-    for row in texto_io:
-        values = row.strip().split(',')
-        rows.append(values)
-    max_cols = max(len(r) for r in rows)
-    rows_padded = [
-        r + [None] * (max_cols - len(r))
-        for r in rows]
-    df = pd.DataFrame(rows_padded,columns=[f'col_{i+1}' for i in range(max_cols)])
-    df_pnori = df[df.iloc[:, 0] == "$PNORI"].dropna(axis=1, how='all')
-    df_pnors = df[df.iloc[:, 0] == "$PNORS"].dropna(axis=1, how='all')
-    df_pnorc = df[df.iloc[:, 0] == "$PNORC"].dropna(axis=1, how='all')
-    df_pnorb = df[df.iloc[:, 0] == "$PNORB"].dropna(axis=1, how='all')
-    df_pnorw = df[df.iloc[:, 0] == "$PNORW"].dropna(axis=1, how='all')
-    df_pnore = df[df.iloc[:, 0] == "$PNORE"].dropna(axis=1, how='all')
-    df_pnorf = df[df.iloc[:, 0] == "$PNORF"].dropna(axis=1, how='all')
-    df_pnorwd = df[df.iloc[:, 0] == "$PNORWD"].dropna(axis=1, how='all')
-    df_pnorc = df_pnorc[df_pnorc.count(axis=1) == 19].copy()
-    df_pnorc = df_pnorc.dropna(axis=1, how='all')
-    # df_pnorc = df_pnorc.drop(5099, axis=0)
+#%% LEITURA DAS SENTENÇAS NMEA DO SIG1000
+# Campos que continuam texto (data/hora com zeros à esquerda, códigos, número da célula como nas colunas _Cell#N)
+CAMPOS_TEXTO_NMEA = {'Identifier', 'Date', 'Time', 'Status_Code', 'Head_ID', 'Cell_number', 'Amplitude_unit'}
+SENTENCA_NMEA = re.compile(rb'\$PNOR[A-Z]*[^$\s"]*')
 
-    df_pnori.columns = parameter_columns_PNORI
-    df_pnorc.columns = parameter_columns_PNORC
-    df_pnorb.columns = parameter_columns_PNORB
-    df_pnorw.columns = parameter_columns_PNORW
-    df_pnors.columns = parameter_columns_PNORS  
-    df_pnors = adicionar_coluna_DATATIME(df_pnors)
-    df_pnorw = adicionar_coluna_DATATIME(df_pnorw)
-    df_pnore= adicionar_coluna_DATATIME(df_pnore)
-    df_pnorb = adicionar_coluna_DATATIME(df_pnorb)
-    df_pnorc = adicionar_coluna_DATATIME(df_pnorc)
+LOTE_SENTENCAS = 20000  # sentenças conferidas de uma vez
+
+def checksums_nmea_validos(corpos, somas):
+    """
+    Confere o *hh de um lote de sentenças numa passada vetorizada: XOR de cada corpo (bytes entre '$' e '*')
+    com np.bitwise_xor.reduceat sobre o lote concatenado, comparado com o hexadecimal declarado.
+    """
+    declarados = np.full(len(corpos), -1)
+    for i, soma in enumerate(somas):
+        try:
+            declarados[i] = int(soma[:2], 16)
+        except ValueError:
+            pass
+    tamanhos = np.fromiter((len(corpo) for corpo in corpos), dtype=np.int64, count=len(corpos))
+    if not tamanhos.all():
+        return np.zeros(len(corpos), dtype=bool)
+    inicios = np.concatenate([[0], np.cumsum(tamanhos)[:-1]])
+    calculados = np.bitwise_xor.reduceat(np.frombuffer(b''.join(corpos), dtype=np.uint8), inicios)
+    return calculados == declarados
+
+def numero_nmea(campo):
+    try:
+        return float(campo)
+    except ValueError:
+        return np.nan
+
+class BufferSentencas:
+    """
+    Colunas de um tipo de sentença ($PNORx) sendo lidas: array('d') para os campos numéricos e lista para
+    os de texto. Sem colunas conhecidas (PNORE, PNORF...), guarda os campos como texto em col_1, col_2...
+    """
+    def __init__(self, colunas=None):
+        self.colunas = colunas
+        self.valores = [] if colunas is None else [[] if c in CAMPOS_TEXTO_NMEA else array('d') for c in colunas]
+
+    def acrescentar(self, campos):
+        if self.colunas is None:
+            self.valores.append(campos)
+            return
+        for buffer, campo in zip(self.valores, campos):
+            buffer.append(campo if isinstance(buffer, list) else numero_nmea(campo))
+
+    def dataframe(self):
+        if self.colunas is None:
+            return pd.DataFrame(self.valores).rename(columns=lambda i: f'col_{i+1}')
+        # lista vazia viraria float64: os campos de texto saem object mesmo sem linhas (Date + ' ' + Time)
+        return pd.DataFrame({coluna: np.frombuffer(buffer, dtype=float) if isinstance(buffer, array)
+                             else buffer if buffer else pd.Series(dtype=object)
+                             for coluna, buffer in zip(self.colunas, self.valores)})
+
+class LeitorNMEA:
+    """
+    Leitura do .dat do SIG1000 que pode continuar de onde parou: guarda os buffers de cada tipo de sentença,
+    o datalogger, a quarentena e até que byte do arquivo já foi lido (só linhas completas).
+    O índice ao lado do .dat (salvar_indice_nmea) guarda só o estado de retomada; as linhas já lidas ficam
+    em partes Parquet (gravar_partes_nmea) e a próxima chamada só lê o que foi acrescentado.
+    """
+    def __init__(self, colunas_por_tipo):
+        self.colunas_por_tipo = colunas_por_tipo
+        self.buffers = {}
+        self.tempos, self.baterias = [], array('d')
+        self.quarentena = []
+        self.offset = 0
+        self.tamanho = self.mtime = None
+        self.cabecalho = b''
+        self.ensemble = None  # (Date, Time) do ensemble sendo lido
+        self.ultimo_ensemble = None  # último ensemble completo (o seguinte já começou)
+
+    def ler(self, caminho_arquivo, ate_o_fim=True):
+        """
+        Lê do offset salvo até o fim do arquivo. Com ate_o_fim=False uma última linha sem quebra de linha
+        (ainda sendo gravada) fica para a próxima leitura. Devolve quantos bytes foram lidos.
+        """
+        lote = []
+        inicio = self.offset
+        with open(caminho_arquivo, 'rb') as f:
+            if not self.cabecalho:
+                self.cabecalho = f.read(256)
+            f.seek(self.offset)
+            for linha in f:
+                if not linha.endswith(b'\n') and not ate_o_fim:
+                    break
+                sentencas = list(SENTENCA_NMEA.finditer(linha))
+                prefixo = linha[:sentencas[0].start()] if sentencas else linha
+                campos_datalogger = prefixo.split(b',')
+                if not prefixo.startswith(b'$') and len(campos_datalogger) >= 3:
+                    self.tempos.append(campos_datalogger[0].strip().strip(b'"').decode('utf-8', 'replace'))
+                    self.baterias.append(numero_nmea(campos_datalogger[2].strip().strip(b'"')))
+                lote.extend((self.offset + sentenca.start(), sentenca.group()) for sentenca in sentencas)
+                if len(lote) >= LOTE_SENTENCAS:
+                    self.despachar(lote)
+                self.offset += len(linha)
+        if lote:
+            self.despachar(lote)
+        estado = os.stat(caminho_arquivo)
+        self.tamanho, self.mtime = estado.st_size, estado.st_mtime
+        return self.offset - inicio
+
+    def despachar(self, lote):
+        """Confere checksum (vetorizado) e número de campos do lote e manda cada sentença ao buffer ou à quarentena."""
+        partes = [texto[1:].partition(b'*') for _, texto in lote]
+        validos = checksums_nmea_validos([corpo for corpo, _, _ in partes], [soma for _, _, soma in partes])
+        for (offset, texto), (corpo, asterisco, _), valido in zip(lote, partes, validos):
+            campos = corpo.decode('utf-8', 'replace').split(',')
+            tipo = campos[0] = '$' + campos[0]
+            colunas = self.colunas_por_tipo.get(tipo)
+            if not asterisco:
+                motivo = 'sem checksum'
+            elif not valido:
+                motivo = 'checksum'
+            elif colunas is not None and len(campos) != len(colunas):
+                motivo = 'campos'
+            else:
+                # o buffer só nasce com a primeira sentença aprovada: tipo todo em quarentena não vira tabela
+                buffer = self.buffers.get(tipo)
+                if buffer is None:
+                    buffer = self.buffers[tipo] = BufferSentencas(colunas)
+                buffer.acrescentar(campos)
+                if buffer.colunas is not None and buffer.colunas[1:3] == ['Date', 'Time'] \
+                        and (campos[1], campos[2]) != self.ensemble:
+                    self.fechar_ensemble()
+                    self.ensemble = (campos[1], campos[2])
+                continue
+            self.quarentena.append({'Offset (bytes)': offset, 'Tipo': tipo, 'Motivo': motivo,
+                                    'Sentenca': texto.decode('utf-8', 'replace')})
+        lote.clear()
+
+    def fechar_ensemble(self):
+        if self.ensemble is None:
+            return
+        tempo = pd.to_datetime(' '.join(self.ensemble), format='%m%d%y %H%M%S', errors='coerce')
+        if pd.notna(tempo) and (self.ultimo_ensemble is None or tempo > self.ultimo_ensemble):
+            self.ultimo_ensemble = tempo
+
+    def resultado(self):
+        """({'$PNORC': df, ...}, df_datalogger, df_quarentena) com tudo o que já foi lido."""
+        df_quarentena = pd.DataFrame(self.quarentena, columns=['Offset (bytes)', 'Tipo', 'Motivo', 'Sentenca'])
+        if not df_quarentena.empty:
+            print(f"{len(df_quarentena)} sentenças em quarentena:")
+            print(df_quarentena.groupby(['Tipo', 'Motivo']).size().to_string())
+        tabelas = {tipo: buffer.dataframe() for tipo, buffer in self.buffers.items()}
+        df_datalogger = pd.DataFrame({'GMT-03:00': self.tempos, 'Battery': np.frombuffer(self.baterias, dtype=float)})
+        return tabelas, df_datalogger, df_quarentena
+
+VERSAO_INDICE_NMEA = 2
+LIMITE_PARTES_NMEA = 32  # acima disso as partes de uma tabela são juntadas num arquivo só
+
+def pasta_partes_nmea(caminho_indice):
+    return caminho_indice + "_dados"
+
+def salvar_indice_nmea(leitor, caminho_indice, partes):
+    """
+    Estado de retomada do LeitorNMEA em JSON (offset, tamanho, mtime, cabeçalho, ensembles) e a lista
+    das partes Parquet com as linhas já lidas. Os buffers não vão para o índice.
+    """
+    estado = {
+        "versao": VERSAO_INDICE_NMEA,
+        "offset": leitor.offset,
+        "tamanho": leitor.tamanho,
+        "mtime": leitor.mtime,
+        "cabecalho": leitor.cabecalho.hex(),
+        "ensemble": None if leitor.ensemble is None else list(leitor.ensemble),
+        "ultimo_ensemble": None if leitor.ultimo_ensemble is None else leitor.ultimo_ensemble.isoformat(),
+        "colunas_por_tipo": leitor.colunas_por_tipo,
+        "partes": partes,
+    }
+    temporario = caminho_indice + ".tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(estado, f)
+    os.replace(temporario, caminho_indice)
+
+def carregar_indice_nmea(caminho_indice, caminho_arquivo, colunas_por_tipo):
+    """
+    (LeitorNMEA pronto para continuar, partes, {tabela: df já lido}) se o índice ainda servir para o arquivo:
+    mesma versão, mesmas colunas, mesmo início do arquivo e tamanho de pelo menos o já lido, com todas as
+    partes legíveis. Senão None (o .dat foi trocado ou truncado, ou o índice é antigo) e o arquivo é lido do zero.
+    """
+    try:
+        with open(caminho_indice, encoding='utf-8') as f:
+            estado = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(estado, dict) or estado.get("versao") != VERSAO_INDICE_NMEA:
+        return None
+    if estado["colunas_por_tipo"] != json.loads(json.dumps(colunas_por_tipo)) \
+            or os.path.getsize(caminho_arquivo) < estado["offset"]:
+        return None
+    cabecalho = bytes.fromhex(estado["cabecalho"])
+    with open(caminho_arquivo, 'rb') as f:
+        if f.read(len(cabecalho)) != cabecalho:
+            return None
+    pasta = pasta_partes_nmea(caminho_indice)
+    try:
+        anteriores = {nome: pd.concat([pd.read_parquet(os.path.join(pasta, arquivo)) for arquivo in arquivos],
+                                      ignore_index=True)
+                      for nome, arquivos in estado["partes"].items()}
+    except (OSError, pa.ArrowException):
+        return None
+    leitor = LeitorNMEA(colunas_por_tipo)
+    leitor.offset, leitor.tamanho, leitor.mtime = estado["offset"], estado["tamanho"], estado["mtime"]
+    leitor.cabecalho = cabecalho
+    leitor.ensemble = None if estado["ensemble"] is None else tuple(estado["ensemble"])
+    leitor.ultimo_ensemble = None if estado["ultimo_ensemble"] is None else pd.Timestamp(estado["ultimo_ensemble"])
+    return leitor, estado["partes"], anteriores
+
+def gravar_partes_nmea(pasta, partes, inicio, novas, anteriores):
+    """
+    Acrescenta as tabelas lidas a partir do byte inicio como novas partes Parquet ({tabela}_{inicio}.parquet).
+    Uma tabela com mais de LIMITE_PARTES_NMEA partes é regravada inteira numa parte só.
+    Devolve os arquivos que deixaram de ser usados (apagar depois de salvar o índice).
+    """
+    os.makedirs(pasta, exist_ok=True)
+    obsoletos = []
+    for nome, df in novas.items():
+        if df.empty:
+            continue
+        arquivo = f"{nome.strip('$')}_{inicio:012d}.parquet"
+        if len(partes.get(nome, [])) >= LIMITE_PARTES_NMEA:
+            obsoletos.extend(partes.pop(nome))
+            df = pd.concat([anteriores[nome], df], ignore_index=True)
+        df.to_parquet(os.path.join(pasta, arquivo), index=False)
+        partes.setdefault(nome, []).append(arquivo)
+    return obsoletos
+
+def juntar_tabelas_nmea(anteriores, novas):
+    tabelas = dict(anteriores)
+    for nome, df in novas.items():
+        if nome not in tabelas or tabelas[nome].empty:
+            tabelas[nome] = df
+        elif not df.empty:
+            tabelas[nome] = pd.concat([tabelas[nome], df], ignore_index=True)
+    return tabelas
+
+def ler_sentencas_nmea(caminho_arquivo, colunas_por_tipo, caminho_indice=None):
+    """
+    Leitura em uma passada do .dat do SIG1000: cada linha é lida uma vez e as sentenças $PNORx
+    (soltas ou dentro do campo de texto do datalogger) vão para o buffer do seu tipo, em lotes.
+    Cada lote tem o checksum *hh conferido de uma vez (checksums_nmea_validos) e depois o número de
+    campos (tipos em colunas_por_tipo); as reprovadas vão para a quarentena com o offset em bytes.
+    Os três primeiros campos da linha do datalogger viram GMT-03:00 e Battery.
+    Com caminho_indice, retoma do fim da leitura anterior e lê só o que foi acrescentado ao arquivo;
+    as linhas das leituras anteriores vêm das partes Parquet em pasta_partes_nmea(caminho_indice).
+    Devolve ({'$PNORC': df, ...}, df_datalogger, df_quarentena).
+    """
+    retomada = carregar_indice_nmea(caminho_indice, caminho_arquivo, colunas_por_tipo) if caminho_indice else None
+    if retomada is None:
+        leitor, partes, anteriores = LeitorNMEA(colunas_por_tipo), {}, {}
+        if caminho_indice:
+            shutil.rmtree(pasta_partes_nmea(caminho_indice), ignore_errors=True)
+    else:
+        leitor, partes, anteriores = retomada
+    estado = os.stat(caminho_arquivo)
+    inicio = leitor.offset
+    if (estado.st_size, estado.st_mtime) != (leitor.tamanho, leitor.mtime):
+        lidos = leitor.ler(caminho_arquivo, ate_o_fim=caminho_indice is None)
+        if caminho_indice:
+            print(f"{lidos} bytes novos lidos de {caminho_arquivo} (último ensemble completo: {leitor.ultimo_ensemble})")
+    tabelas, df_datalogger, df_quarentena = leitor.resultado()
+    novas = dict(tabelas, datalogger=df_datalogger, quarentena=df_quarentena)
+    if caminho_indice and leitor.offset > inicio:
+        try:
+            obsoletos = gravar_partes_nmea(pasta_partes_nmea(caminho_indice), partes, inicio, novas, anteriores)
+            salvar_indice_nmea(leitor, caminho_indice, partes)
+            for arquivo in obsoletos:
+                os.remove(os.path.join(pasta_partes_nmea(caminho_indice), arquivo))
+        except OSError as e:
+            print(f"Não foi possível salvar o índice {caminho_indice}: {e}")
+    tabelas = juntar_tabelas_nmea(anteriores, novas)
+    return tabelas, tabelas.pop('datalogger'), tabelas.pop('quarentena')
+
+def organizar_String_adcp(caminho_arquivo,parameter_columns_PNORC,parameter_columns_PNORI,parameter_columns_PNORS,parameter_columns_PNORB,parameter_columns_PNORW,parameter_columns,retornar_quarentena=False,caminho_indice=None ):
+    """
+    Tabelas de cada sentença do .dat; com retornar_quarentena=True, a tabela da quarentena vem por último.
+    caminho_indice: índice ao lado do .dat para ler só o trecho novo de um arquivo que continua crescendo.
+    """
+    colunas_por_tipo = {"$PNORI": parameter_columns_PNORI, "$PNORS": parameter_columns_PNORS, "$PNORC": parameter_columns_PNORC,
+                        "$PNORB": parameter_columns_PNORB, "$PNORW": parameter_columns_PNORW}
+    tabelas, df_datalogger, df_quarentena = ler_sentencas_nmea(caminho_arquivo, colunas_por_tipo, caminho_indice)
+
+    def tabela(tipo):
+        if tipo in tabelas:
+            return tabelas[tipo]
+        return pd.DataFrame(columns=colunas_por_tipo.get(tipo, []))
+    df_pnori = tabela("$PNORI")
+    df_pnors = adicionar_coluna_DATATIME(tabela("$PNORS"))
+    df_pnorw = adicionar_coluna_DATATIME(tabela("$PNORW"))
+    df_pnore = adicionar_coluna_DATATIME(tabela("$PNORE"))
+    df_pnorc = adicionar_coluna_DATATIME(tabela("$PNORC"))
+    df_pnorwd = tabela("$PNORWD")
+    df_pnorb = adicionar_coluna_DATATIME(tabela("$PNORB"))
+    df_pnorf = tabela("$PNORF")
+    if retornar_quarentena:
+        return df_pnori, df_pnors, df_pnorw, df_pnore, df_pnorc, df_pnorwd, df_pnorb, df_pnorf, df_datalogger, df_quarentena
     return df_pnori, df_pnors, df_pnorw, df_pnore, df_pnorc, df_pnorwd, df_pnorb, df_pnorf, df_datalogger
 
 #####
@@ -414,40 +1380,99 @@ def import_and_merge_wave_parameter(df_pnorb,df_pnors,df_pnorw):
 
         
     return df_ondas
-def import_and_merge_curr_parameter(df_pnors,df_pnorc):
-    ultima_coluna = df_pnorc.columns[-1]
-    df_pnorc['prioridade'] = df_pnorc[ultima_coluna].notna().astype(int)
-    df_pnorc = df_pnorc.sort_values(by=['prioridade'], ascending=False)
-    df_pnorc = df_pnorc.drop_duplicates(subset=['Date', 'Time', 'Cell_number'], keep='first')
-    df_pnorc = df_pnorc.drop(columns='prioridade')
-    df_pnorc['Cell_number'] = df_pnorc['Cell_number'].astype(str)
-    df_pnorc['row_id'] = df_pnorc.groupby(['Identifier','Date', 'Time','GMT-03:00']).ngroup()
-    
-    value_cols = [col for col in df_pnorc.columns if col not in ['Identifier','Date', 'GMT-03:00','Time', 'Cell_number', 'row_id']]
-    df_pnorc[value_cols] = df_pnorc[value_cols].apply(pd.to_numeric, errors='coerce')
-
-    df_pnorc_wide = df_pnorc.pivot(index='row_id', columns='Cell_number', values=value_cols)
-    df_pnorc_wide.columns = [f"{param}_Cell#{cell}" for param, cell in df_pnorc_wide.columns]
-    ids = df_pnorc[['row_id', 'Date', 'Time']].drop_duplicates()
-    df_pnorc = ids.merge(df_pnorc_wide.reset_index(), on='row_id').drop(columns='row_id')
-    df_pnorc = adicionar_coluna_DATATIME(df_pnorc)
-    df_pnorc['GMT-03:00'] = pd.to_datetime(df_pnorc['GMT-03:00'], errors='coerce')
-    df_pnors['GMT-03:00'] = pd.to_datetime(df_pnors['GMT-03:00'], errors='coerce')
-    df_correntes = df_pnorc.merge(df_pnors.reset_index(), on='GMT-03:00', how='left')
-    df_correntes['GMT-03:00'] = pd.to_datetime(df_correntes['GMT-03:00'], errors='coerce')
-    df_correntes = df_correntes.sort_values(by='GMT-03:00')
-    # df_correntes=df_correntes[parameter_columns_correntes]
-
-    # df_correntes = df_correntes[[col for col in df_correntes.columns if any(param in col for param in parameter_columns_correntes)]]# linha descontinuada pra aumentar a rigorosidade dos filtros
-    # for coluna in df_correntes.columns:# linha descontinuada pois esta quebrando o df e causando lentidao quando sao muitas colunas add de uma unica vez
-    #     df_correntes[f'Flag_{coluna}'] = 0
-        # Cria todas as colunas de flag de uma vez
+def tempo_nmea(df):
+    """Data/hora das colunas Date (MMDDYY) e Time (HHMMSS) das sentenças, com formato fixo."""
+    return pd.to_datetime(df['Date'].astype(str) + ' ' + df['Time'].astype(str), format='%m%d%y %H%M%S', errors='coerce')
 
-    
-    # Opcional: desfaz a fragmentação acumulada
-    df_correntes = df_correntes.copy()
+def cubo_celulas(df_pnorc):
+    """
+    PNORC (uma linha por célula) num cubo numpy pré-alocado, sem groupby/ngroup/pivot: ensemble (data/hora)
+    e célula viram índices inteiros (pd.factorize) e os valores de cada linha são espalhados no cubo.
+    Na mesma data/hora/célula repetida vale a primeira linha completa (última coluna preenchida), como antes.
+    Eixos do cubo: (ensemble, variável, célula), para que a tabela larga seja só um reshape (sem cópia).
+    Devolve (tempos dos ensembles, números das células, variáveis, cubo, linha do df de cada ensemble).
+    """
+    tempos = tempo_nmea(df_pnorc)
+    numeros_celula = pd.to_numeric(df_pnorc['Cell_number'], errors='coerce')
+    validas = np.flatnonzero((tempos.notna() & numeros_celula.notna()).to_numpy())
+    variaveis = [coluna for coluna in df_pnorc.columns
+                 if coluna not in ['Identifier', 'Date', 'GMT-03:00', 'Time', 'Cell_number']]
+    valores = np.column_stack([coluna_numerica(df_pnorc, coluna, gravar=False).to_numpy(dtype=float, na_value=np.nan)
+                               for coluna in variaveis]) if variaveis else np.empty((len(df_pnorc), 0))
+
+    indice_ensemble, ensembles = pd.factorize(tempos.iloc[validas], sort=True)
+    indice_celula, celulas = pd.factorize(numeros_celula.iloc[validas].astype(int), sort=True)
+    # linhas completas primeiro, na ordem do arquivo; a primeira de cada (ensemble, célula) é a que fica
+    completa = df_pnorc[df_pnorc.columns[-1]].notna().to_numpy()[validas]
+    ordem = np.argsort(~completa, kind='stable')
+    _, primeiras = np.unique((indice_ensemble * len(celulas) + indice_celula)[ordem], return_index=True)
+    escolhidas = ordem[primeiras]
+
+    cubo = np.full((len(ensembles), len(variaveis), len(celulas)), np.nan)
+    cubo[indice_ensemble[escolhidas], :, indice_celula[escolhidas]] = valores[validas[escolhidas]]
+    _, primeira_linha = np.unique(indice_ensemble, return_index=True)
+    return pd.DatetimeIndex(ensembles), np.asarray(celulas), variaveis, cubo, validas[primeira_linha]
 
-    return df_correntes
+def import_and_merge_curr_parameter(df_pnors,df_pnorc):
+    """
+    Tabela larga das correntes ({parametro}_Cell#{n} por ensemble) junto com o PNORS do mesmo horário.
+    A tabela larga é uma vista do cubo de cubo_celulas; o PNORS entra por posição (get_indexer), sem merge.
+    """
+    tempos, celulas, variaveis, cubo, linhas = cubo_celulas(df_pnorc)
+    colunas = [f"{variavel}_Cell#{celula}" for variavel in variaveis for celula in celulas]
+    df_correntes = pd.DataFrame(cubo.reshape(len(tempos), len(colunas)), columns=colunas, copy=False)
+    df_correntes.insert(0, 'GMT-03:00', tempos)
+    df_correntes.insert(1, 'Date', df_pnorc['Date'].to_numpy()[linhas])
+    df_correntes.insert(2, 'Time', df_pnorc['Time'].to_numpy()[linhas])
+
+    # PNORS do mesmo timestamp (o primeiro, se repetido); colunas com o mesmo nome ganham _x/_y como no merge
+    if {'Date', 'Time'} <= set(df_pnors.columns):
+        df_pnors['GMT-03:00'] = tempo_nmea(df_pnors)
+    else:
+        df_pnors['GMT-03:00'] = pd.to_datetime(df_pnors['GMT-03:00'], errors='coerce')
+    df_status = df_pnors.reset_index().drop_duplicates(subset='GMT-03:00')
+    posicoes = pd.Index(df_status['GMT-03:00']).get_indexer(tempos)
+    df_status = df_status.drop(columns='GMT-03:00').reset_index(drop=True).reindex(posicoes)
+    repetidas = [coluna for coluna in df_status.columns if coluna in df_correntes.columns]
+    df_correntes = df_correntes.rename(columns={coluna: f"{coluna}_x" for coluna in repetidas})
+    df_status = df_status.rename(columns={coluna: f"{coluna}_y" for coluna in repetidas})
+    return pd.concat([df_correntes, df_status.set_index(df_correntes.index)], axis=1)
+
+def compactar_tipos(df, parameter_columns=(), coluna_tempo='GMT-03:00'):
+    """
+    Modo de tipos compactos (opcional), aplicado logo depois da leitura: medidas float32, Flag_ uint8,
+    colunas de texto (Identifier, Date, Time...) como category e o tempo em datetime64[ns].
+    Parâmetros ainda em texto ficam para tipar_colunas, que no modo compacto já converte para float32.
+    O uso de memória antes/depois vai para df.attrs["memoria"] (MB).
+    O tempo em texto (caminho Date/Time do ADCP) também é convertido aqui, com o mesmo pd.to_datetime
+    que o QC usaria depois; se não converter, fica como está para o QC tratar.
+    """
+    antes = df.memory_usage(deep=True).sum() / 2**20
+    parametros = set(parameter_columns)
+    tipos = {}
+    if coluna_tempo in df.columns and not pd.api.types.is_datetime64_any_dtype(df[coluna_tempo]):
+        try:
+            df = df.assign(**{coluna_tempo: pd.to_datetime(df[coluna_tempo])})
+        except (ValueError, TypeError):
+            pass
+    for coluna in df.columns:
+        serie = df[coluna]
+        if str(coluna).startswith('Flag_'):
+            if pd.api.types.is_numeric_dtype(serie) and not serie.isna().any():
+                tipos[coluna] = np.uint8
+        elif pd.api.types.is_datetime64_any_dtype(serie):
+            if getattr(serie.dt, 'tz', None) is None:
+                tipos[coluna] = 'datetime64[ns]'
+        elif pd.api.types.is_float_dtype(serie):
+            tipos[coluna] = np.float32
+        elif (pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie)) \
+                and coluna not in parametros and coluna != coluna_tempo:
+            tipos[coluna] = 'category'
+    df = df.astype(tipos)
+    depois = df.memory_usage(deep=True).sum() / 2**20
+    print(f"Tipos compactos: {antes:.1f} MB -> {depois:.1f} MB")
+    df.attrs["memoria"] = {"Antes (MB)": round(antes, 2), "Depois (MB)": round(depois, 2)}
+    return df
 def importar_dados_corrente_string_ADCP(df_PNORC,df_PNORI,df_PNORS,parameter_columns_PNORC,parameter_columns_PNORI,parameter_columns_PNORS,parameter_columns):    # Ajustar os nomes das colunas
     df_PNORC.columns = parameter_columns_PNORC
     df_PNORI.columns = parameter_columns_PNORI
@@ -607,47 +1632,93 @@ def plot_historical_series(df, parameter_columns):
 
 #%% MODULO QC ##FIXME
 #TESTE 1: Time Offset.
-def time_offset(df, dict_offset):
+def time_offset(df, dict_offset, timestamp_inicial=None, flags=None):
+    flags, avulso = abrir_flags(df, flags, ['GMT-03:00'])
     limite_futuro_segundos = dict_offset["GMT-03:00"]["limite_futuro_segundos"]
     limite_passado_segundos = dict_offset["GMT-03:00"]["limite_passado_segundos"]
     df['GMT-03:00'] = pd.to_datetime(df['GMT-03:00'])
     tempo_atual = pd.Timestamp.now()
-    timestamp_inicial = df['GMT-03:00'].iloc[0]
-    df["Flag_GMT-03:00"] |= np.where(df['GMT-03:00'] > tempo_atual + pd.to_timedelta(limite_futuro_segundos, unit='s'), 4, 0)
+    # No modo incremental o primeiro timestamp é o da série inteira, não o do trecho
+    if timestamp_inicial is None:
+        timestamp_inicial = df['GMT-03:00'].iloc[0]
+    flags.marcar('GMT-03:00', df['GMT-03:00'] > tempo_atual + pd.to_timedelta(limite_futuro_segundos, unit='s'))
     limite_passado_tempo = timestamp_inicial - pd.to_timedelta(limite_passado_segundos, unit='s')
-    df["Flag_GMT-03:00"] |= np.where(df['GMT-03:00'] < limite_passado_tempo, 4, 0)
+    flags.marcar('GMT-03:00', df['GMT-03:00'] < limite_passado_tempo)
     func_name = inspect.currentframe().f_code.co_name
-    return df, func_name
+    return fechar_flags(df, flags, avulso), func_name
 
 
 
 # #TESTE 2: Range Check Sensors.
-def range_check_sensors(df, limites_range_check, alert_window_size,parameter_columns):
-
-    for parameter_column, valores in limites_range_check.items():
-        if parameter_column not in parameter_columns:
-            continue
-        limite_inferior_sensor = valores.get("sensores_min")
-        limite_superior_sensor = valores.get("sensores_max")
-        
-        df[parameter_column] = pd.to_numeric(df[parameter_column], errors='coerce')
-        condition_fail_sensor = (df[parameter_column] > limite_superior_sensor) | (df[parameter_column] < limite_inferior_sensor)
-        df[f'Flag_{parameter_column}'] |= np.where(condition_fail_sensor, 4, 0)
-        alerta(alert_window_size, parameter_column, range_check_sensors.__name__, df)
-    return df, inspect.currentframe().f_code.co_name
+def range_check_sensors(df, limites_range_check, alert_window_size,parameter_columns, flags=None):
+    flags, avulso = abrir_flags(df, flags, parameter_columns)
+    colunas = marcar_fora_da_faixa(df, limites_range_check, parameter_columns, "sensores_min", "sensores_max", flags)
+    for parameter_column in colunas:
+        alerta(alert_window_size, parameter_column, range_check_sensors.__name__, flags)
+    return fechar_flags(df, flags, avulso), inspect.currentframe().f_code.co_name
 
 #TESTE 3: Range Check Enviroment.
-def range_check_enviroment (df, limites_range_check,alert_window_size,parameter_columns):
-    for parameter_column, valores in limites_range_check.items():
-        if parameter_column not in parameter_columns:
+def range_check_enviroment (df, limites_range_check,alert_window_size,parameter_columns, flags=None):
+    flags, avulso = abrir_flags(df, flags, parameter_columns)
+    colunas = marcar_fora_da_faixa(df, limites_range_check, parameter_columns, "ambiental_min", "ambiental_max", flags)
+    for parameter_column in colunas:
+        alerta(alert_window_size, parameter_column, range_check_enviroment.__name__, flags)
+    return fechar_flags(df, flags, avulso), inspect.currentframe().f_code.co_name
+
+def marcar_fora_da_faixa(df, limites_range_check, parameter_columns, campo_min, campo_max, flags):
+    """
+    Range check de todas as colunas com limite de uma vez: o bloco float (linhas x colunas) é comparado
+    com os vetores de mínimo e máximo por coluna. Colunas sem limite configurado ficam de fora.
+    Devolve as colunas testadas, na ordem de limites_range_check.
+    """
+    colunas, limites = vetores_limiares(limites_range_check, [campo_min, campo_max],
+                                        [coluna for coluna in limites_range_check if coluna in parameter_columns])
+    if not colunas:
+        return colunas
+    bloco = blocos_numericos(df, colunas)
+    flags.marcar_varias(colunas, (bloco > limites[:, 1]) | (bloco < limites[:, 0]))
+    return colunas
+
+def blocos_numericos(df, colunas):
+    """Matriz float (linhas x colunas); as colunas que não são numéricas são convertidas no df (pd.to_numeric)."""
+    for coluna in colunas:
+        coluna_numerica(df, coluna)
+    return df[colunas].to_numpy(dtype=float, na_value=np.nan)
+
+def coluna_numerica(df, coluna, gravar=True):
+    """
+    Coluna como número. Dentro de aplicar_filtros as colunas já chegam tipadas (tipar_colunas) e isto só
+    checa o dtype; em chamadas avulsas de um teste, converte com pd.to_numeric e grava no df.
+    """
+    serie = df[coluna]
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie
+    serie = pd.to_numeric(serie, errors='coerce')
+    if gravar:
+        df[coluna] = serie
+    return serie
+
+def tipar_colunas(df, parameter_columns, coluna_tempo=None, compacto=False):
+    """
+    Etapa de tipagem do QC: converte para número, uma única vez, as colunas de parâmetro que ainda não
+    são numéricas (as de tempo ficam como estão). Devolve (df, falhas), com o tipo original de cada
+    coluna convertida e quantos valores não vazios não viraram número.
+    Com compacto=True (df que passou por compactar_tipos) as colunas convertidas ficam em float32.
+    """
+    falhas = []
+    for coluna in dict.fromkeys(parameter_columns):
+        if coluna in (coluna_tempo, 'GMT-03:00') or coluna not in df.columns:
             continue
-        limite_inferior_ambiental = valores.get("ambiental_min")
-        limite_superior_ambiental = valores.get("ambiental_max")
-        df[parameter_column] = pd.to_numeric(df[parameter_column], errors='coerce')
-        condition_fail_sensor = (df[parameter_column] > limite_superior_ambiental) | (df[parameter_column] < limite_inferior_ambiental)
-        df[f'Flag_{parameter_column}'] |= np.where(condition_fail_sensor, 4, 0)
-        alerta(alert_window_size, parameter_column, range_check_enviroment.__name__, df)
-    return df, inspect.currentframe().f_code.co_name
+        serie = df[coluna]
+        if pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_datetime64_any_dtype(serie):
+            continue
+        convertida = pd.to_numeric(serie, errors='coerce')
+        n_falhas = int((serie.notna() & convertida.isna()).sum())
+        if n_falhas:
+            print(f"{n_falhas} valores não numéricos viraram NaN em {coluna}")
+        falhas.append({'Parametro': coluna, 'Tipo Original': str(serie.dtype), 'Falhas Conversao': n_falhas})
+        df[coluna] = convertida.astype(np.float32) if compacto else convertida
+    return df, falhas
 
 
 #TESTE 4: Identificar Gaps.
@@ -664,50 +1735,83 @@ def range_check_enviroment (df, limites_range_check,alert_window_size,parameter_
 #         alerta(alert_window_size, parameter_column, identificar_gaps.__name__, df)       
 #     return df, inspect.currentframe().f_code.co_name
 
-def identificar_gaps(df, sampling_frequency, parameter_columns, coluna_tempo, alert_window_size):
+def identificar_gaps(df, sampling_frequency, parameter_columns, coluna_tempo, alert_window_size, flags=None):
     
     """
     Identifica e preenche gaps no DataFrame com tolerância ao atraso.
     Marca flags apenas quando há ausência real de dados (gap > limite_segurança).
     """
+    flags, avulso = abrir_flags(df, flags, parameter_columns)
     limite_segurança=sampling_frequency/3
     df[coluna_tempo] = pd.to_datetime(df[coluna_tempo])
 
     # Arredonda os timestamps para a grade mais próxima do intervalo desejado
     df[coluna_tempo] = df[coluna_tempo].dt.round(f'{sampling_frequency}min')
 
-    # Cria novo índice baseado na grade esperada
-    inicio = df[coluna_tempo].min().floor(f'{sampling_frequency}min')
-    fim = df[coluna_tempo].max().ceil(f'{sampling_frequency}min')
-    novo_indice = pd.date_range(start=inicio, end=fim, freq=f'{sampling_frequency}min')
-
-    # Junta o DataFrame aos tempos esperados
-    df = df.drop_duplicates(subset=coluna_tempo)
+    # Linha do df em cada ponto da grade esperada, calculada uma vez para todas as colunas
+    novo_indice, posicoes = grade_regular(df[coluna_tempo], sampling_frequency)
+    df = df.drop(columns=coluna_tempo).reset_index(drop=True).reindex(posicoes).reset_index(drop=True)
+    df.insert(0, coluna_tempo, novo_indice)
+    # As flags acompanham as linhas que sobraram; linhas novas (gaps) começam em 0
+    flags.reindexar(posicoes)
+    # Tabela de trechos sem dado, para o dashboard: fica na matriz de flags (aplicar_filtros a devolve
+    # em attrs["gaps"]) ou, em chamada avulsa, em df.attrs["gaps"]
+    flags.gaps = intervalos_de_gap(novo_indice, posicoes, sampling_frequency)
+
+    # Marca flag de gap se a diferença entre pontos for maior que o limite de segurança (todas as colunas de uma vez)
+    time_diffs = df[coluna_tempo].diff().dt.total_seconds().div(60).fillna(sampling_frequency).to_numpy()
+    colunas = list(dict.fromkeys(parameter_columns))
+    flag_real_gap = df[colunas].isna().to_numpy() & (time_diffs > limite_segurança)[:, None]
+    flags.marcar_varias(colunas, flag_real_gap)
 
-    df = df.set_index(coluna_tempo).reindex(novo_indice).rename_axis(coluna_tempo).reset_index()
-
-    # Marca flag de gap se a diferença entre pontos for maior que o limite de segurança
     for parameter_column in parameter_columns:
-        df[f'Flag_{parameter_column}'] = df.get(f'Flag_{parameter_column}', 0).fillna(0).astype(int)
-        gaps = df[parameter_column].isna()
-        
-        # Apenas marca flag se o gap é real
-        time_diffs = df[coluna_tempo].diff().dt.total_seconds().div(60).fillna(sampling_frequency)
-        flag_real_gap = (gaps) & (time_diffs > limite_segurança)
-        df[f'Flag_{parameter_column}'] |= np.where(flag_real_gap, 4, 0)
-
-        alerta(alert_window_size, parameter_column, identificar_gaps.__name__, df)
+        alerta(alert_window_size, parameter_column, identificar_gaps.__name__, flags)
 
+    df = fechar_flags(df, flags, avulso)
+    if avulso:
+        df.attrs["gaps"] = flags.gaps.to_dict('records')
     return df, inspect.currentframe().f_code.co_name
 
+def grade_regular(tempos, sampling_frequency):
+    """
+    Grade de sampling_frequency minutos entre o primeiro e o último tempo (já arredondados) e, para
+    cada ponto dela, a linha de 'tempos' que cai ali (primeira ocorrência; -1 = gap).
+    A busca é um searchsorted sobre os inteiros em ns, sem reindexar o df por timestamp.
+    """
+    frequencia = f'{sampling_frequency}min'
+    validos = tempos.notna().to_numpy()
+    novo_indice = pd.date_range(start=tempos.min().floor(frequencia), end=tempos.max().ceil(frequencia), freq=frequencia)
+    grade = novo_indice.as_unit('ns').asi8
+    unicos, primeira = np.unique(pd.DatetimeIndex(tempos[validos]).as_unit('ns').asi8, return_index=True)
+    linhas = np.flatnonzero(validos)[primeira]
+    indices = np.minimum(np.searchsorted(grade, unicos), len(grade) - 1)
+    na_grade = grade[indices] == unicos
+    posicoes = np.full(len(grade), -1, dtype=np.int64)
+    posicoes[indices[na_grade]] = linhas[na_grade]
+    return novo_indice, posicoes
+
+def intervalos_de_gap(novo_indice, posicoes, sampling_frequency):
+    """Trechos seguidos da grade sem dado: início, fim, amostras faltantes e duração em minutos."""
+    falta = np.concatenate([[False], posicoes < 0, [False]])
+    bordas = np.flatnonzero(np.diff(falta.astype(np.int8)))
+    inicios, fins = bordas[0::2], bordas[1::2] - 1
+    amostras = fins - inicios + 1
+    return pd.DataFrame({
+        'Inicio': novo_indice[inicios],
+        'Fim': novo_indice[fins],
+        'Amostras': amostras,
+        'Duracao (min)': amostras * sampling_frequency,
+    })
+
 
 #TESTE 5: Identificar dados nulos.
-def identificar_dados_nulos(df,parameter_columns,alert_window_size):
+def identificar_dados_nulos(df,parameter_columns,alert_window_size, flags=None):
     # a função verifica se o valor observado é nulo (missing value, -9999, etc)
+    flags, avulso = abrir_flags(df, flags, parameter_columns)
     for parameter_column in parameter_columns:
-        df[f'Flag_{parameter_column}']|= np.where(df[parameter_column].isnull(), 4,0)
-        alerta(alert_window_size, parameter_column, identificar_dados_nulos.__name__, df) 
-    return df, inspect.currentframe().f_code.co_name
+        flags.marcar(parameter_column, df[parameter_column].isnull())
+        alerta(alert_window_size, parameter_column, identificar_dados_nulos.__name__, flags) 
+    return fechar_flags(df, flags, avulso), inspect.currentframe().f_code.co_name
 
 #Teste 6: Spike Test.
 # def spike_test(df, dict_spike,alert_window_size):#versao descontinuada por nao servir para dados direcionais
@@ -724,29 +1828,26 @@ def identificar_dados_nulos(df,parameter_columns,alert_window_size):
 #         alerta(alert_window_size, parameter_column, spike_test.__name__, df)
 #     return df, inspect.currentframe().f_code.co_name
 
-def spike_test(df, dict_spike, alert_window_size, parametros_direcionais):
-    
+def spike_test(df, dict_spike, alert_window_size, parametros_direcionais, flags=None, estatisticas=None):
     
+    flags, avulso = abrir_flags(df, flags, [])
     for parameter_column, params in dict_spike.items():
         if parameter_column not in df.columns:
             continue  # pula se a coluna não existe no DataFrame
         window = params['window']
         threshold_factor = params['threshold_factor']
-        df[parameter_column] = pd.to_numeric(df[parameter_column], errors='coerce')
+        coluna_numerica(df, parameter_column)
         is_directional = parameter_column in parametros_direcionais
+        rolling_mean, rolling_std = estatisticas_moveis(df[parameter_column], window, is_directional, estatisticas)
         if is_directional:
-            rolling_mean = df[parameter_column].rolling(window=window, min_periods=1).apply(circular_mean, raw=False)
-            rolling_std = df[parameter_column].rolling(window=window, min_periods=1).apply(circular_std, raw=False)
             diffs = angular_diff(df[parameter_column], rolling_mean)
         else:
-            rolling_mean = df[parameter_column].rolling(window=window, min_periods=1).mean()
-            rolling_std = df[parameter_column].rolling(window=window, min_periods=1).std()
             diffs = (df[parameter_column] - rolling_mean).abs()
         limiar = threshold_factor * rolling_std
         condition_spike = diffs > limiar
-        df[f'Flag_{parameter_column}'] |= np.where(condition_spike, 4, 0)
-        alerta(alert_window_size, parameter_column, spike_test.__name__, df)
-    return df, inspect.currentframe().f_code.co_name
+        flags.marcar(parameter_column, condition_spike)
+        alerta(alert_window_size, parameter_column, spike_test.__name__, flags)
+    return fechar_flags(df, flags, avulso), inspect.currentframe().f_code.co_name
 
 
 #Teste 7: LT Time series rate of change.#versao descontinuada por nao servir para dados direcionais
@@ -761,26 +1862,23 @@ def spike_test(df, dict_spike, alert_window_size, parametros_direcionais):
 #     return df, inspect.currentframe().f_code.co_name
 
 
-def lt_time_series_rate_of_change(df, dict_lt_time_and_regressao, alert_window_size, parametros_direcionais):
+def lt_time_series_rate_of_change(df, dict_lt_time_and_regressao, alert_window_size, parametros_direcionais, flags=None, estatisticas=None):
+    flags, avulso = abrir_flags(df, flags, [])
     for parameter_column, params in dict_lt_time_and_regressao.items():
         if parameter_column not in df.columns:
             continue
         delta_thresh = params["delta_lt_time"]
-        df[parameter_column] = pd.to_numeric(df[parameter_column], errors='coerce')
-        if parameter_column in parametros_direcionais:
-            diff_fw = angular_diff(df[parameter_column], df[parameter_column].shift(1))
-            diff_bw = angular_diff(df[parameter_column], df[parameter_column].shift(-1))
-        else:
-            diff_fw = df[parameter_column].diff().abs()
-            diff_bw = df[parameter_column].shift(-1).subtract(df[parameter_column]).abs()
+        coluna_numerica(df, parameter_column)
+        # A diferença para trás de uma linha é a diferença para frente da linha seguinte
+        diff_fw = diferencas_absolutas(df[parameter_column], parameter_column in parametros_direcionais, estatisticas)
+        diff_bw = diff_fw.shift(-1)
         condicao_fw = diff_fw >= delta_thresh
         condicao_bw = diff_bw >= delta_thresh
         condicao_final = condicao_fw & condicao_bw  # sinal mais forte: pico isolado
         condicao_leve = condicao_fw | condicao_bw   # marca também os dois lados, se quiser
-        df[f'Flag_{parameter_column}'] = df.get(f'Flag_{parameter_column}', 0)
-        df[f'Flag_{parameter_column}'] |= np.where(condicao_final, 4, 0)
-        alerta(alert_window_size, parameter_column, lt_time_series_rate_of_change.__name__, df)
-    return df, inspect.currentframe().f_code.co_name
+        flags.marcar(parameter_column, condicao_final)
+        alerta(alert_window_size, parameter_column, lt_time_series_rate_of_change.__name__, flags)
+    return fechar_flags(df, flags, avulso), inspect.currentframe().f_code.co_name
 
 
 #Teste 8: Continuidade tempo.
@@ -797,124 +1895,106 @@ def lt_time_series_rate_of_change(df, dict_lt_time_and_regressao, alert_window_s
 #         alerta(alert_window_size, parameter_column, teste_continuidade_tempo.__name__, df) 
 #     return df, inspect.currentframe().f_code.co_name
 
-def teste_continuidade_tempo(df, limite_sigma_aceitavel_and_dict_delta_site, alert_window_size, parametros_direcionais):
+def teste_continuidade_tempo(df, limite_sigma_aceitavel_and_dict_delta_site, alert_window_size, parametros_direcionais, flags=None, estatisticas=None):
     
+    flags, avulso = abrir_flags(df, flags, [])
     for parameter_column, config in limite_sigma_aceitavel_and_dict_delta_site.items():
         if parameter_column not in df.columns:
             continue  # ignora colunas ausentes
 
         window = config["window"]
         n_desvpad_fail = config["delta"]
-        df[parameter_column] = pd.to_numeric(df[parameter_column], errors='coerce')
-
-        flag_col = f'Flag_{parameter_column}'
-        if flag_col not in df.columns:
-            df[flag_col] = 0
-
-        if parameter_column in parametros_direcionais:
-            rolling_mean = df[parameter_column].rolling(window=window, min_periods=1).apply(circular_mean, raw=False)
-            rolling_std = df[parameter_column].rolling(window=window, min_periods=1).apply(circular_std, raw=False)
+        coluna_numerica(df, parameter_column)
 
+        direcional = parameter_column in parametros_direcionais
+        rolling_mean, rolling_std = estatisticas_moveis(df[parameter_column], window, direcional, estatisticas)
+        if direcional:
             diffs = angular_diff(df[parameter_column], rolling_mean)
             limiar = n_desvpad_fail * rolling_std
             condition_fail = diffs > limiar
         else:
-            rolling_mean = df[parameter_column].rolling(window=window, min_periods=1).mean()
-            rolling_std = df[parameter_column].rolling(window=window, min_periods=1).std()
             upper_limit = rolling_mean + n_desvpad_fail * rolling_std
             lower_limit = rolling_mean - n_desvpad_fail * rolling_std
             condition_fail = (df[parameter_column] > upper_limit) | (df[parameter_column] < lower_limit)
 
-        df[flag_col] |= np.where(condition_fail, 4, 0)
-        alerta(alert_window_size, parameter_column, teste_continuidade_tempo.__name__, df)
+        flags.marcar(parameter_column, condition_fail)
+        alerta(alert_window_size, parameter_column, teste_continuidade_tempo.__name__, flags)
 
-    return df, inspect.currentframe().f_code.co_name
+    return fechar_flags(df, flags, avulso), inspect.currentframe().f_code.co_name
 
 
 
 
 #Teste 9: Identificar duplicatas.
-def identificar_duplicatas_tempo(df,parameter_columns,alert_window_size):
+def identificar_duplicatas_tempo(df,parameter_columns,alert_window_size, flags=None):
     # a função verifica se os valores de tempo não estão duplicados
+    flags, avulso = abrir_flags(df, flags, parameter_columns)
     for parameter_column in parameter_columns:      
         duplicatas = df.index.duplicated()    
-        df[f'Flag_{parameter_column}'] |= np.where(duplicatas, 4, 0)
-        alerta(alert_window_size, parameter_column, identificar_duplicatas_tempo.__name__, df) 
-    return df, inspect.currentframe().f_code.co_name
+        flags.marcar(parameter_column, duplicatas)
+        alerta(alert_window_size, parameter_column, identificar_duplicatas_tempo.__name__, flags) 
+    return fechar_flags(df, flags, avulso), inspect.currentframe().f_code.co_name
 
 
 #Teste 10: Verificar dados repetidos.
-def verifica_dados_repetidos(df, limite_repeticao_dados, alert_window_size,parameter_columns):
+def verifica_dados_repetidos(df, limite_repeticao_dados, alert_window_size,parameter_columns, flags=None):
+    # Sensor travado: corrida de pelo menos "fail" valores iguais (ou dentro de "tolerancia"); marca a corrida inteira
+    flags, avulso = abrir_flags(df, flags, parameter_columns)
+    testadas = [p for p in limite_repeticao_dados
+                if p in parameter_columns and p not in ["Tp_sea", "Tp_swell"]]
+    if testadas:
+        valores = np.column_stack([coluna_numerica(df, p, gravar=False).to_numpy(dtype=float, na_value=np.nan) for p in testadas])
+        fail = np.array([limite_repeticao_dados[p]["fail"] for p in testadas])
+        tolerancia = [limite_repeticao_dados[p].get("tolerancia", 0) for p in testadas]
+        condition_fail = (comprimento_corridas(valores, tolerancia) >= fail) & ~np.isnan(valores)
+        for j, parameter_column in enumerate(testadas):
+            flags.marcar(parameter_column, condition_fail[:, j])
     for parameter_column in limite_repeticao_dados:
         if parameter_column not in parameter_columns:
             continue
-        if parameter_column not in ["Tp_sea", "Tp_swell"]:
-
-            fail = limite_repeticao_dados[parameter_column]["fail"]
-            rolling_fail = df[parameter_column].rolling(window=fail)
-            condition_fail = rolling_fail.apply(lambda x: len(set(x)) == 1, raw=True).dropna()
-            df[f'Flag_{parameter_column}'] |= np.where(condition_fail.reindex(df.index, fill_value=False), 4, 0)
-        alerta(alert_window_size, parameter_column, verifica_dados_repetidos.__name__, df)
-    return df, inspect.currentframe().f_code.co_name
+        alerta(alert_window_size, parameter_column, verifica_dados_repetidos.__name__, flags)
+    return fechar_flags(df, flags, avulso), inspect.currentframe().f_code.co_name
 
 # Teste 11: ST Time series segment.
-def st_time_series_segment_shift(df, st_time_series_dict, alert_window_size, parametros_direcionais): 
+def st_time_series_segment_shift(df, st_time_series_dict, alert_window_size, parametros_direcionais, posicao_inicial=0, flags=None): 
+    flags, avulso = abrir_flags(df, flags, [])
     for parameter_column, params in st_time_series_dict.items():
 
         if parameter_column not in df.columns:
             continue  # Ignora colunas que não existem no df
 
         # Cria coluna de flag se não existir
-        flag_col = f'Flag_{parameter_column}'
-        if flag_col not in df.columns:
-            df[flag_col] = 0
-        else:
-            df[flag_col] = df[flag_col].fillna(0).astype(int)
+        flag = flags.coluna(parameter_column)
 
-        m_points = params['m_points']
+        m_points = int(params['m_points'])
         P = params['mean_shift_threshold']
 
-        # Cria uma série temporária para trabalhar, convertendo para numérico
-        temp_series = pd.to_numeric(df[parameter_column], errors='coerce')
+        # Série numérica para trabalhar (sem gravar no df)
+        temp_series = coluna_numerica(df, parameter_column, gravar=False)
 
-        n_segments = len(temp_series) // m_points
-        if n_segments < 2:
+        matriz = segmentos(temp_series, m_points, posicao_inicial)
+        if len(matriz) < 2:
             continue  # não há segmentos suficientes para comparar
 
-        segments = [temp_series.iloc[i * m_points : (i + 1) * m_points] for i in range(n_segments)]
-
-        # Cálculo da média por segmento
-        if parameter_column in parametros_direcionais or 'dir' in parameter_column.lower():
-            # Direcionais: usa média angular
-            segment_means = [mean_direction(segment.dropna()) for segment in segments]
-        else:
-            # Não direcionais: média normal
-            segment_means = [segment.dropna().mean() for segment in segments]
-
-        # Aplica o critério de mudança abrupta entre segmentos
-        for i in range(1, len(segment_means)):
-            diff_value = abs(segment_means[i] - segment_means[i - 1])
+        # Cálculo da média por segmento (angular para os direcionais)
+        direcional = parameter_column in parametros_direcionais or 'dir' in parameter_column.lower()
+        segment_means = media_segmentos(matriz, direcional)
 
-            if diff_value >= P:
-                start_idx = i * m_points
-                end_idx = (i + 1) * m_points
-
-                # Garante que os índices não ultrapassem o DataFrame
-                end_idx = min(end_idx, len(df))
-
-                # Marca a flag com operação bitwise segura
-                df.iloc[start_idx:end_idx, df.columns.get_loc(flag_col)] = (
-                    df.iloc[start_idx:end_idx, df.columns.get_loc(flag_col)].astype(int) | 4
-                )
+        # Aplica o critério de mudança abrupta entre segmentos consecutivos
+        with np.errstate(invalid='ignore'):
+            mudou = np.abs(np.diff(segment_means)) >= P
+        linhas = segmentos_para_linhas(np.concatenate([[False], mudou]), m_points, len(flag), inicio_segmentos(m_points, posicao_inicial))
+        flag |= np.where(linhas, 4, 0).astype(np.uint8)
 
         # Chama a função de alerta (suponho que ela já exista no seu código)
-        alerta(alert_window_size, parameter_column, st_time_series_segment_shift.__name__, df)
+        alerta(alert_window_size, parameter_column, st_time_series_segment_shift.__name__, flags)
 
-    return df, inspect.currentframe().f_code.co_name
+    return fechar_flags(df, flags, avulso), inspect.currentframe().f_code.co_name
 
 
 # Teste 12: Max Min.
-def max_min_test(df, dict_max_min_test,parametros_direcionais): 
+def max_min_test(df, dict_max_min_test,parametros_direcionais, posicao_inicial=0, flags=None): 
+    flags, avulso = abrir_flags(df, flags, [])
     for parameter_column, params in dict_max_min_test.items():
         if parameter_column not in df.columns:
             continue  # ignora colunas ausentes
@@ -924,109 +2004,108 @@ def max_min_test(df, dict_max_min_test,parametros_direcionais):
         m_points = params["m_points"]
         #window_size = params["window_size"]
         window_size = len (df)
-        df[parameter_column] = pd.to_numeric(df[parameter_column], errors='coerce')
+        coluna_numerica(df, parameter_column)
         invalid_positions = df[parameter_column].isna()
         if invalid_positions.any():
             print(f"Valores não numéricos encontrados na coluna '{parameter_column}' nos índices: {df[invalid_positions].index.tolist()}")
-        n_segments = window_size // m_points
-        segments = [df.iloc[i * m_points: (i + 1) * m_points] for i in range(n_segments)]
-        flag_col = f'Flag_{parameter_column}'
-        if flag_col not in df.columns:
-            df[flag_col] = 0
-        for i, segment in enumerate(segments):
-            segment_values = segment[parameter_column].values
+        matriz = segmentos(df[parameter_column], int(m_points), posicao_inicial)
+        flag = flags.coluna(parameter_column)
+        linhas = slice(inicio_segmentos(int(m_points), posicao_inicial), None)
+        linhas = slice(linhas.start, linhas.start + matriz.size)
+        with np.errstate(invalid='ignore'):
             if 'dir' in parameter_column.lower():
-                diffs = diferenca_angular(segment_values, np.roll(segment_values, -1))
-                diffs[-1] = 0  # Manter o último valor em 0
-                ampli_values = np.abs(diffs)
-                df.loc[segment.index, flag_col] |= np.where(ampli_values >= delta, 4, 0)
+                diffs = diferenca_angular(matriz, np.roll(matriz, -1, axis=1))
+                diffs[:, -1] = 0  # Manter o último valor de cada segmento em 0
+                flag[linhas] |= np.where(np.abs(diffs) >= delta, 4, 0).astype(np.uint8).ravel()
             else:
-                ampli_value = abs(segment[parameter_column].max() - segment[parameter_column].min())
-                df.loc[segment.index, flag_col] |= np.where(ampli_value >= delta, 3, 0)
-        alerta(window_size, parameter_column, max_min_test.__name__, df)
-    return df, inspect.currentframe().f_code.co_name
+                ampli_values = np.abs(amplitude_segmentos(matriz))
+                flag[linhas] |= np.where(segmentos_para_linhas(ampli_values >= delta, int(m_points), matriz.size), 3, 0).astype(np.uint8)
+        alerta(window_size, parameter_column, max_min_test.__name__, flags)
+    return fechar_flags(df, flags, avulso), inspect.currentframe().f_code.co_name
 
 
 #TESTE 13: Temperatura vs Ponto de orvalho
-def verificar_temperatura_vs_ponto_de_orvalho(df,alert_window_size):
+def verificar_temperatura_vs_ponto_de_orvalho(df,alert_window_size, flags=None):
 # a função verifica se o valor de velocidade do vento é maior que a rajada de vento.
     parameter_column='Dew Point'
-    df['Flag_Dew Point'] |= np.where(df['Dew Point'] >= df['Temperature'], 4, 0)
+    flags, avulso = abrir_flags(df, flags, [parameter_column])
+    flags.marcar('Dew Point', df['Dew Point'] >= df['Temperature'])
     func_name = inspect.currentframe().f_code.co_name
-    alerta(alert_window_size, parameter_column, func_name, df)
-    return df, func_name   
+    alerta(alert_window_size, parameter_column, func_name, flags)
+    return fechar_flags(df, flags, avulso), func_name   
 
 #TESTE 14: Velocidade vs rajada
-def verificar_velocidade_vs_rajada(df,alert_window_size):
+def verificar_velocidade_vs_rajada(df,alert_window_size, flags=None):
 # a função verifica se o valor de velocidade do vento é maior que a rajada de vento.
     parameter_column='Gust Speed(m/s)'
-    df['Flag_Wind Speed(m/s)'] |= np.where(df['Wind Speed(m/s)'] > df['Gust Speed(m/s)'], 4, 0)
+    flags, avulso = abrir_flags(df, flags, ['Wind Speed(m/s)', parameter_column])
+    flags.marcar('Wind Speed(m/s)', df['Wind Speed(m/s)'] > df['Gust Speed(m/s)'])
     func_name = inspect.currentframe().f_code.co_name
-    alerta(alert_window_size, parameter_column, func_name, df)
-    return df, func_name   
+    alerta(alert_window_size, parameter_column, func_name, flags)
+    return fechar_flags(df, flags, avulso), func_name   
 
 #TESTE 15: Verificar altura max vs sig
-def verificar_altura_max_vs_sig(df,Hs,Hmax):
-    
+def verificar_altura_max_vs_sig(df,Hs,Hmax, flags=None):
     
-    df[f'Flag_{Hmax}'] |= np.where((df[Hs] > df[Hmax]), 4, 0)
+    flags, avulso = abrir_flags(df, flags, [Hmax])
+    flags.marcar(Hmax, df[Hs] > df[Hmax])
     func_name = inspect.currentframe().f_code.co_name
-    return df, func_name   
+    return fechar_flags(df, flags, avulso), func_name   
 
 #TESTE 16: SIGNAL ADCP GRADIENT
 import re
 import inspect
 import pandas as pd
 
-def gradiente_de_amplitude_do_sinal(df):
+def colunas_por_celula(df, categoria):
+    """Colunas da categoria (Amplitude/Speed/Direction) ordenadas pelo número da célula."""
+    celulas = []
+    for variavel, colunas in mapa_celulas(df.columns).items():
+        if variavel.lower().startswith(categoria.lower()):
+            celulas += colunas.items()
+    return [coluna for _, coluna in sorted(celulas, key=lambda item: item[0])]
+
+def perfil_celulas(df, colunas):
+    """Matriz (tempo x célula) numérica das colunas, na ordem dada."""
+    return blocos_numericos(df, colunas).reshape(len(df), len(colunas))
+
+def janelas_de_celulas(condicao, window):
+    """True onde a condição vale em todas as 'window' posições seguidas ao longo das células (eixo 1)."""
+    if window <= 0:
+        return np.ones((condicao.shape[0], condicao.shape[1] + 1), dtype=bool)
+    return np.lib.stride_tricks.sliding_window_view(condicao, window, axis=1).all(axis=2)
+
+def gradiente_de_amplitude_do_sinal(df, flags=None):
+    flags, avulso = abrir_flags(df, flags, [])
     amplitude_columns = ['Amplitude']
     speed_columns = ['Speed']
     direction_columns = ['Direction']
 
-    # Função para extrair número da célula da coluna
-    def extrair_numero_celula(nome_coluna):
-        match = re.search(r'Cell#(\d+)', nome_coluna)
-        return int(match.group(1)) if match else -1
-
     # Função para criar dicionário {num_celula: nome_coluna}
     def criar_mapa_colunas(prefixos):
-        colunas = [col for col in df.columns if any(col.startswith(p) for p in prefixos)]
-        mapa = {extrair_numero_celula(col): col for col in colunas if extrair_numero_celula(col) != -1}
+        mapa = {}
+        for variavel, colunas in mapa_celulas(df.columns).items():
+            if any(variavel.startswith(p) for p in prefixos):
+                mapa.update(colunas)
         return dict(sorted(mapa.items()))
 
     mapa_amplitude = criar_mapa_colunas(amplitude_columns)
     mapa_speed = criar_mapa_colunas(speed_columns)
     mapa_direction = criar_mapa_colunas(direction_columns)
     for col in set(mapa_amplitude.values()) | set(mapa_speed.values()) | set(mapa_direction.values()):
-        df[col] = pd.to_numeric(df[col], errors='coerce')
+        coluna_numerica(df, col)
     numeros_celulas = sorted(mapa_amplitude.keys())
-    for i in range(1, len(numeros_celulas)):
-        prev_num = numeros_celulas[i - 1]
-        curr_num = numeros_celulas[i]
-        prev_col = mapa_amplitude[prev_num]
-        curr_col = mapa_amplitude[curr_num]
-        condition_fail = df[curr_col] > df[prev_col]
-        for idx in range(i, len(numeros_celulas)):
-            num = numeros_celulas[idx]
-            amp_col = mapa_amplitude[num]
-            flag_amp = f"Flag_{amp_col}"
-            if flag_amp not in df.columns:
-                df[flag_amp] = 0
-            df.loc[condition_fail & (df[flag_amp] == 0), flag_amp] = 4
-            speed_col = mapa_speed.get(num)
-            if speed_col:
-                flag_speed = f"Flag_{speed_col}"
-                if flag_speed not in df.columns:
-                    df[flag_speed] = 0
-                df.loc[condition_fail & (df[flag_speed] == 0), flag_speed] = 4
-            direction_col = mapa_direction.get(num)
-            if direction_col:
-                flag_dir = f"Flag_{direction_col}"
-                if flag_dir not in df.columns:
-                    df[flag_dir] = 0
-                df.loc[condition_fail & (df[flag_dir] == 0), flag_dir] = 4
+    if len(numeros_celulas) > 1:
+        amplitude = perfil_celulas(df, [mapa_amplitude[num] for num in numeros_celulas])
+        # A amplitude deve cair com a distância: a partir da primeira célula que cresce, o resto do perfil falha
+        condition_fail = np.logical_or.accumulate(amplitude[:, 1:] > amplitude[:, :-1], axis=1)
+        for k, num in enumerate(numeros_celulas[1:]):
+            for col in (mapa_amplitude[num], mapa_speed.get(num), mapa_direction.get(num)):
+                if col:
+                    flag = flags.coluna(col)
+                    flag[condition_fail[:, k] & (flag == 0)] = 4
     func_name = inspect.currentframe().f_code.co_name
-    return df, func_name
+    return fechar_flags(df, flags, avulso), func_name
 
 #TESTE 17: Detectar platos verticais
 # def detectar_platos(df, threshold_plato, categorias=["Amplitude", "Speed", "Direction"]):
@@ -1052,54 +2131,312 @@ def gradiente_de_amplitude_do_sinal(df):
 
 #     return df,func_name
 
-def detectar_platos(df, threshold_plato, categorias=["Amplitude", "Speed", "Direction"]):
+def detectar_platos(df, threshold_plato, categorias=["Amplitude", "Speed", "Direction"], flags=None):
+    flags, avulso = abrir_flags(df, flags, [])
     for categoria in categorias:
         threshold = threshold_plato[categoria]["threshold"]
         window = threshold_plato[categoria]["window"]
-        categoria_columns = [col for col in df.columns if col.lower().startswith(categoria.lower())]
-        cell_numbers = [int(col.split('#')[1].split('_')[0]) for col in categoria_columns]
-        categoria_order = pd.DataFrame({'Cell': cell_numbers, 'Column': categoria_columns}).sort_values('Cell')
-        sorted_columns = categoria_order['Column'].tolist()
-        df[sorted_columns] = df[sorted_columns].apply(pd.to_numeric, errors='coerce')
-        for i in range(len(sorted_columns) - window + 1):
-            window_columns = sorted_columns[i:i + window]
-            is_plato = pd.Series(True, index=df.index)
-            for j in range(1, len(window_columns)):
-                diff = abs(df[window_columns[j]] - df[window_columns[j - 1]])
-                is_plato &= diff <= threshold
-            for col in window_columns:
-                flag_col = f"Flag_{col}"
-                if flag_col not in df.columns:
-                    df[flag_col] = 0
-                df[flag_col] = np.where(is_plato, np.maximum(df[flag_col], 4), df[flag_col])
+        sorted_columns = colunas_por_celula(df, categoria)
+        valores = perfil_celulas(df, sorted_columns)
+        if window < 1 or len(sorted_columns) < window:
+            continue
+        # Platô: todas as diferenças entre células vizinhas da janela dentro do threshold
+        with np.errstate(invalid='ignore'):
+            is_plato = janelas_de_celulas(np.abs(np.diff(valores, axis=1)) <= threshold, window - 1)
+        # Cada célula recebe a flag se estiver em qualquer janela em platô
+        borda = np.zeros((len(df), window - 1), dtype=bool)
+        fora_de_plato = janelas_de_celulas(~np.hstack([borda, is_plato, borda]), window)
+        for k, col in enumerate(sorted_columns):
+            flag = flags.coluna(col)
+            np.maximum(flag, 4, out=flag, where=~fora_de_plato[:, k])
     func_name = inspect.currentframe().f_code.co_name
-    return df, func_name
+    return fechar_flags(df, flags, avulso), func_name
 
 #TESTE 18: Taxa de mudanca vertical
 
-def taxa_de_mudanca_vertical(df, threshold_mudanca_abrupta, categorias=["amplitude", "speed", "direction"]):
+def taxa_de_mudanca_vertical(df, threshold_mudanca_abrupta, categorias=["amplitude", "speed", "direction"], flags=None):
+    flags, avulso = abrir_flags(df, flags, [])
     for categoria in categorias:
         threshold = threshold_mudanca_abrupta[categoria]["threshold"]
         window = threshold_mudanca_abrupta[categoria]["window"]
-        categoria_columns = [col for col in df.columns if col.lower().startswith(categoria.lower())]
-        cell_numbers = [int(col.split('#')[1].split('_')[0]) for col in categoria_columns]
-        categoria_order = pd.DataFrame({'Cell': cell_numbers, 'Column': categoria_columns}).sort_values('Cell')
-        sorted_columns = categoria_order['Column'].tolist()
-        df[sorted_columns] = df[sorted_columns].apply(pd.to_numeric, errors='coerce')
-        for i in range(len(sorted_columns) - window + 1):
-            window_columns = sorted_columns[i:i + window]
-            for j in range(1, len(window_columns)):
-                previous_col = window_columns[j - 1]
-                current_col = window_columns[j]
-                condition_fail = abs(df[current_col] - df[previous_col]) > threshold
-                flag_column_name = f"Flag_{current_col}"
-                if flag_column_name not in df.columns:
-                    df[flag_column_name] = 0
-                df[flag_column_name] |= np.where(condition_fail, 4, 0)
+        sorted_columns = colunas_por_celula(df, categoria)
+        valores = perfil_celulas(df, sorted_columns)
+        # Todo par de células vizinhas cabe em alguma janela quando há células suficientes
+        if window < 2 or len(sorted_columns) < window:
+            continue
+        with np.errstate(invalid='ignore'):
+            condition_fail = np.abs(np.diff(valores, axis=1)) > threshold
+        for k, current_col in enumerate(sorted_columns[1:]):
+            flags.marcar(current_col, condition_fail[:, k])
     func_name = inspect.currentframe().f_code.co_name
-    return df,func_name
+    return fechar_flags(df, flags, avulso),func_name
+
+
+
+#%% REGISTRO DOS TESTES
+# Colunas de altura significativa / máxima usadas no F15 por tipo de sensor
+COLUNAS_ALTURA = {
+    "ONDAS": ("Hm0", "Hmax"),
+    "ONDAS_NAO_DIRECIONAIS": ("HS_256Hz", "Hmax_calc_256Hz"),
+}
+
+def _teste(funcao, entradas, tipos_sensor=None, por_coluna=False, reindexa=False, estatisticas=None):
+    """Entrada do registro: função, nomes das entradas (na ordem dos argumentos), sensores a que se aplica,
+    se roda coluna a coluna, se reindexa as linhas e quais estatísticas pede ao cache:
+    ("moveis", configuração com 'window') ou ("diferencas", configuração das colunas)."""
+    return {
+        "funcao": funcao,
+        "entradas": entradas,
+        "tipos_sensor": tipos_sensor,
+        "por_coluna": por_coluna,
+        "reindexa": reindexa,
+        "estatisticas": estatisticas,
+    }
+
+# Ordem de execução = ordem do registro
+REGISTRO_TESTES = {
+    "F01_time_offset": _teste(time_offset, ["dict_offset", "timestamp_inicial"]),
+    "F02_range_check_sensors": _teste(range_check_sensors, ["limites_range_check", "alert_window_size", "parameter_columns"], por_coluna=True),
+    "F03_range_check_env": _teste(range_check_enviroment, ["limites_range_check", "alert_window_size", "parameter_columns"], por_coluna=True),
+    "F04_gaps": _teste(identificar_gaps, ["sampling_frequency", "parameter_columns", "coluna_tempo", "alert_window_size"], reindexa=True),
+    "F05_nulos": _teste(identificar_dados_nulos, ["parameter_columns", "alert_window_size"], por_coluna=True),
+    "F06_spike": _teste(spike_test, ["dict_spike", "alert_window_size", "parametros_direcionais"], por_coluna=True,
+                        estatisticas=("moveis", "dict_spike")),
+    "F07_lt_trend": _teste(lt_time_series_rate_of_change, ["dict_lt_time_and_regressao", "alert_window_size", "parametros_direcionais"], por_coluna=True,
+                           estatisticas=("diferencas", "dict_lt_time_and_regressao")),
+    "F08_tempo_continuidade": _teste(teste_continuidade_tempo, ["limite_sigma_aceitavel_and_dict_delta_site", "alert_window_size", "parametros_direcionais"],
+                                     por_coluna=True, estatisticas=("moveis", "limite_sigma_aceitavel_and_dict_delta_site")),
+    "F09_duplicatas": _teste(identificar_duplicatas_tempo, ["parameter_columns", "alert_window_size"], por_coluna=True),
+    "F10_repetidos": _teste(verifica_dados_repetidos, ["limite_repeticao_dados", "alert_window_size", "parameter_columns"], por_coluna=True),
+    "F11_st_segment": _teste(st_time_series_segment_shift, ["st_time_series_dict", "alert_window_size", "parametros_direcionais", "posicao_inicial"], por_coluna=True),
+    "F12_max_min": _teste(max_min_test, ["dict_max_min_test", "parametros_direcionais", "posicao_inicial"], por_coluna=True),
+    "F13_temp_vs_dew": _teste(verificar_temperatura_vs_ponto_de_orvalho, ["alert_window_size"], tipos_sensor=["METEOROLOGIA"]),
+    "F14_vel_vs_rajada": _teste(verificar_velocidade_vs_rajada, ["alert_window_size"], tipos_sensor=["METEOROLOGIA"]),
+    "F15_altura_max_vs_sig": _teste(verificar_altura_max_vs_sig, ["Hs", "Hmax"], tipos_sensor=list(COLUNAS_ALTURA)),
+    "F16_grad_sinal": _teste(gradiente_de_amplitude_do_sinal, [], tipos_sensor=["CORRENTES"]),
+    "F17_platos": _teste(detectar_platos, ["threshold_plato", "categorias_perfil"], tipos_sensor=["CORRENTES"]),
+    "F18_mudanca_vert": _teste(taxa_de_mudanca_vertical, ["threshold_mudanca_abrupta", "categorias_perfil"], tipos_sensor=["CORRENTES"]),
+}
+
+#%% MODO INCREMENTAL
+def aplicar_filtros_incremental(df_novo, estado, *args, **kwargs):
+    """
+    QC só das amostras novas. Recebe os mesmos argumentos de aplicar_filtros depois do df
+    e o 'estado' da chamada anterior (None na primeira). Reprocessa as amostras novas junto
+    com o contexto guardado no estado (maior janela móvel, corridas de valores repetidos em
+    aberto, segmento anterior do ST, segmento atual do max/min) e devolve
+    (df_final, df_resultados, estado):
+    - df_final: linhas que ficaram definitivas nesta chamada, com as mesmas flags de uma
+      rodada completa sobre a série inteira;
+    - linhas que ainda dependem de amostras futuras (vizinha seguinte do F07, corrida curta
+      do F10, segmento incompleto do F11/F12) ficam em estado["provisorio"];
+    - df_resultados se refere ao trecho reprocessado (contexto + novas).
+    Só dados em ordem: amostras até o último timestamp já recebido são descartadas.
+    """
+    argumentos = inspect.signature(aplicar_filtros).bind(df_novo, *args, **kwargs)
+    argumentos.apply_defaults()
+    qc = dict(argumentos.arguments)
+    coluna_tempo = qc["coluna_tempo"]
+    frequencia = f'{qc["sampling_frequency"]}min'
+    passo = pd.Timedelta(frequencia)
+    com_grade = bool(qc["filtros_ativos"].get("F04_gaps"))
+
+    df_novo = df_novo.copy()
+    df_novo[coluna_tempo] = pd.to_datetime(df_novo[coluna_tempo])
+    if estado is None:
+        coluna_offset = 'GMT-03:00' if 'GMT-03:00' in df_novo.columns else coluna_tempo
+        estado = {
+            "dados": df_novo.iloc[:0],
+            "timestamp_inicial": pd.to_datetime(df_novo[coluna_offset]).iloc[0] if len(df_novo) else None,
+            "origem": None,
+            "inicio_contexto": 0,
+            "proxima_posicao": 0,
+            "ultimo_tempo": None,
+            "provisorio": None,
+        }
+    elif estado["ultimo_tempo"] is not None:
+        df_novo = df_novo[df_novo[coluna_tempo] > estado["ultimo_tempo"]]
+    if df_novo.empty:
+        return df_novo, pd.DataFrame(), estado
+
+    dados = pd.concat([estado["dados"], df_novo], ignore_index=True)
+    posicao_inicial = estado["inicio_contexto"]
+    entrada = dados
+    if com_grade:
+        tempos = dados[coluna_tempo].dt.round(frequencia)
+        if estado["origem"] is None:
+            estado["origem"] = tempos.min().floor(frequencia)
+        # A grade do F04 tem que começar exatamente no início do contexto (linha de gap, se faltar dado)
+        ancora = estado["origem"] + posicao_inicial * passo
+        if tempos.min().floor(frequencia) > ancora:
+            linha_ancora = {coluna: [ancora] for coluna in {coluna_tempo, 'GMT-03:00'} if coluna in dados.columns}
+            entrada = pd.concat([dados, pd.DataFrame(linha_ancora)], ignore_index=True)
+
+    qc.update(df=entrada.copy(), timestamp_inicial=estado["timestamp_inicial"], posicao_inicial=posicao_inicial)
+    df_qc, df_resultados = aplicar_filtros(**qc)
+
+    posicoes = posicao_inicial + np.arange(len(df_qc))
+    fim = posicao_inicial + len(df_qc)
+    proxima = max(estado["proxima_posicao"], _posicao_pendente(df_qc, qc, fim))
+    df_final = df_qc[(posicoes >= estado["proxima_posicao"]) & (posicoes < proxima)]
+    estado["provisorio"] = df_qc[posicoes >= proxima]
+
+    # Guarda só o trecho bruto que a próxima chamada precisa rever
+    contexto = max(_inicio_contexto(df_qc, qc, proxima), posicao_inicial)
+    if com_grade:
+        posicao_bruta = ((tempos - estado["origem"]) / passo).round().astype(int)
+        estado["dados"] = dados[(posicao_bruta >= contexto).to_numpy()].reset_index(drop=True)
+    else:
+        estado["dados"] = dados.iloc[contexto - posicao_inicial:].reset_index(drop=True)
+    estado["inicio_contexto"] = contexto
+    estado["proxima_posicao"] = proxima
+    estado["ultimo_tempo"] = dados[coluna_tempo].max()
+    return df_final, df_resultados, estado
+
+def _colunas_repetidos(df_qc, qc):
+    return {coluna: params for coluna, params in qc["limite_repeticao_dados"].items()
+            if coluna in qc["parameter_columns"] and coluna in df_qc.columns and coluna not in ["Tp_sea", "Tp_swell"]}
+
+def _segmentos_ativos(df_qc, qc):
+    """(m_points, é_max_min) dos testes de segmento ativos, para as colunas presentes."""
+    ativos = qc["filtros_ativos"]
+    tamanhos = []
+    if ativos.get("F11_st_segment"):
+        tamanhos += [(int(params["m_points"]), False) for coluna, params in qc["st_time_series_dict"].items()
+                     if coluna in df_qc.columns]
+    if ativos.get("F12_max_min"):
+        tamanhos += [(int(params["m_points"]), True) for coluna, params in qc["dict_max_min_test"].items()
+                     if coluna in df_qc.columns and coluna not in qc["parametros_direcionais"]]
+    return tamanhos
+
+def _posicao_pendente(df_qc, qc, fim):
+    """Primeira posição global cuja flag ainda pode mudar com amostras futuras."""
+    ativos = qc["filtros_ativos"]
+    pendente = fim
+    if ativos.get("F07_lt_trend") and any(coluna in df_qc.columns for coluna in qc["dict_lt_time_and_regressao"]):
+        pendente = fim - 1  # a última linha ainda não tem vizinha seguinte
+    if ativos.get("F10_repetidos"):
+        for coluna, params in _colunas_repetidos(df_qc, qc).items():
+            valores = pd.to_numeric(df_qc[coluna], errors='coerce').to_numpy(dtype=float)
+            if len(valores) and not np.isnan(valores[-1]):
+                corrida = comprimento_corridas(valores[:, None], params.get("tolerancia", 0))[-1, 0]
+                if corrida < params["fail"]:
+                    pendente = min(pendente, fim - corrida)  # corrida em aberto ainda curta
+    for m_points, _ in _segmentos_ativos(df_qc, qc):
+        pendente = min(pendente, fim // m_points * m_points)  # segmento incompleto
+    return pendente
+
+def _inicio_contexto(df_qc, qc, proxima):
+    """Posição global mais antiga de que as linhas a partir de 'proxima' dependem."""
+    ativos = qc["filtros_ativos"]
+    inicio = proxima
+    for codigo, configuracao in (("F06_spike", qc["dict_spike"]),
+                                 ("F08_tempo_continuidade", qc["limite_sigma_aceitavel_and_dict_delta_site"])):
+        if ativos.get(codigo):
+            for coluna, params in configuracao.items():
+                if coluna in df_qc.columns:
+                    inicio = min(inicio, proxima - (params["window"] - 1))
+    if ativos.get("F07_lt_trend"):
+        inicio = min(inicio, proxima - 1)
+    if ativos.get("F10_repetidos"):
+        for params in _colunas_repetidos(df_qc, qc).values():
+            inicio = min(inicio, proxima - (params["fail"] - 1))
+    for m_points, max_min in _segmentos_ativos(df_qc, qc):
+        # max/min precisa do próprio segmento; o ST também do segmento anterior
+        inicio = min(inicio, proxima // m_points * m_points - (0 if max_min else m_points))
+    return max(inicio, 0)
+
+def salvar_estado_incremental(estado, caminho):
+    with open(caminho, 'wb') as f:
+        pickle.dump(estado, f)
+
+def carregar_estado_incremental(caminho):
+    """Estado salvo por salvar_estado_incremental, ou None se ainda não existir."""
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, 'rb') as f:
+        return pickle.load(f)
+
+#%% QC EM BLOCOS (arquivos maiores que a memória)
+def ler_em_blocos(caminho, linhas_por_bloco, **opcoes_leitura):
+    """Lê um CSV ou Parquet em pedaços de até linhas_por_bloco linhas, na ordem do arquivo."""
+    if caminho.lower().endswith(".parquet"):
+        for lote in pq.ParquetFile(caminho).iter_batches(batch_size=linhas_por_bloco):
+            yield lote.to_pandas()
+    else:
+        yield from pd.read_csv(caminho, chunksize=linhas_por_bloco, **opcoes_leitura)
+
+class GravadorEmBlocos:
+    """Acrescenta DataFrames a um CSV ou Parquet de saída, sem manter o que já foi gravado em memória."""
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.parquet = caminho.lower().endswith(".parquet")
+        self.escritor = None
+        self.linhas = 0
+        if os.path.exists(caminho):
+            os.remove(caminho)
+
+    def gravar(self, df):
+        if df.empty:
+            return
+        if self.parquet:
+            if self.escritor is None:
+                self.escritor = pq.ParquetWriter(self.caminho, pa.Schema.from_pandas(df, preserve_index=False))
+            # um bloco com coluna toda vazia vem com outro dtype: converte para o esquema do primeiro
+            self.escritor.write_table(pa.Table.from_pandas(df, schema=self.escritor.schema, preserve_index=False))
+        else:
+            df.to_csv(self.caminho, mode='a', header=self.linhas == 0, index=False)
+        self.linhas += len(df)
 
+    def fechar(self):
+        if self.escritor is not None:
+            self.escritor.close()
 
+def aplicar_filtros_em_blocos(caminho_entrada, caminho_saida, *args, linhas_por_bloco=100000,
+                              opcoes_leitura=None, **kwargs):
+    """
+    QC de um arquivo (CSV ou Parquet, em ordem de tempo) grande demais para a memória.
+    Recebe os mesmos argumentos de aplicar_filtros depois do df. Cada bloco lido passa por
+    aplicar_filtros_incremental, que reaproveita só o contexto necessário do bloco anterior
+    (maior janela móvel, corrida de repetidos, segmentos do ST/max-min, conforme os limiares),
+    então as flags das bordas ficam iguais às de uma rodada sobre a série inteira.
+    As linhas definitivas vão sendo gravadas em caminho_saida; a memória depende do tamanho
+    do bloco e das janelas, não do comprimento do arquivo.
+    Devolve o resumo por parâmetro (linhas com alguma flag), calculado sobre as linhas gravadas.
+    """
+    gravador = GravadorEmBlocos(caminho_saida)
+    parametros = list(dict.fromkeys(args[0] if args else kwargs["parameter_columns"]))
+    falhos = dict.fromkeys(parametros, 0)
+    estado = None
+
+    def gravar(df):
+        for parametro in parametros:
+            coluna_flag = f'Flag_{parametro}'
+            if coluna_flag in df.columns:
+                falhos[parametro] += int((df[coluna_flag] != 0).sum())
+        gravador.gravar(df)
+
+    try:
+        for numero, bloco in enumerate(ler_em_blocos(caminho_entrada, linhas_por_bloco, **(opcoes_leitura or {}))):
+            df_final, _, estado = aplicar_filtros_incremental(bloco, estado, *args, **kwargs)
+            gravar(df_final)
+            print(f"Bloco {numero}: {len(bloco)} linhas lidas, {gravador.linhas} gravadas")
+        # Fim do arquivo: as linhas provisórias não vão mais mudar
+        if estado is not None and estado["provisorio"] is not None:
+            gravar(estado["provisorio"])
+    finally:
+        gravador.fechar()
+
+    total = gravador.linhas
+    return pd.DataFrame([{
+        'Teste': aplicar_filtros_em_blocos.__name__,
+        'Parametro': parametro,
+        'Porcentagem Confiáveis': round(100 * (total - falhos[parametro]) / total, 2) if total else 0,
+        'Porcentagem Falhos': round(100 * falhos[parametro] / total, 2) if total else 0,
+        'Total de dados': total,
+        'Falhos': falhos[parametro],
+        'Confiáveis': total - falhos[parametro],
+    } for parametro in parametros])
 
 ##FIXME
 
@@ -10,12 +10,14 @@ parameter_columns_PNORB = ['Identifier','Date','Time','Spectrum_basis_type','Pro
 parameter_columns_PNORI = ['Identifier','Instrument_type','Head_ID','Number_of_beams','Number_of_cells','Blanking(m)','Cell_size(m)','Checksum']
 parameter_columns_PNORS = ['Identifier','Date','Time','Error_code','Status_Code','Battery','Sound_Speed','Heading','Pitch','Roll','Pressure(dbar)','Temperature(C)','Analog_Input_1','Checksum']
 
-from QC_FLAGS_UMISAN import import_and_merge_curr_parameter,import_and_merge_wave_parameter,organizar_String_adcp
-def processar_correntes(dfs,parameter_columns_correntes):
+from QC_FLAGS_UMISAN import import_and_merge_curr_parameter,import_and_merge_wave_parameter,organizar_String_adcp,compactar_tipos
+def processar_correntes(dfs,parameter_columns_correntes,compactar=False):
     df_correntes = import_and_merge_curr_parameter(dfs["df_pnors"], dfs["df_pnorc"])
     df_correntes = df_correntes[
     [col for col in parameter_columns_correntes if col in df_correntes.columns]
 ]
+    if compactar:  # float32 / category / datetime64[ns] para caber um ano de células em memória
+        df_correntes = compactar_tipos(df_correntes, parameter_columns_correntes)
     # df_correntes = df_correntes.assign(**{f"Flag_{col}": 0 for col in df_correntes.columns})
     return df_correntes
 
@@ -24,5 +26,7 @@ def processar_ondas(dfs):
     # df_ondas = df_ondas.assign(**{f"Flag_{col}": 0 for col in df_ondas.columns})
     return df_ondas
 def organizar_dados_adcp(input_file, parameter_columns):
-    (df_pnori,df_pnors,df_pnorw,df_pnore,df_pnorc,df_pnorwb,df_pnorb,df_pnorf,df_datalogger,) = organizar_String_adcp(input_file,parameter_columns_PNORC,parameter_columns_PNORI,parameter_columns_PNORS,parameter_columns_PNORB,parameter_columns_PNORW,parameter_columns,)
-    return {"df_pnori": df_pnori,"df_pnors": df_pnors,"df_pnorw": df_pnorw,"df_pnore": df_pnore,"df_pnorc": df_pnorc,"df_pnorwb": df_pnorwb,"df_pnorb": df_pnorb,"df_pnorf": df_pnorf,"df_datalogger": df_datalogger,    }
+    # O índice <arquivo>.indice guarda o que já foi lido: o .dat que cresce só tem o trecho novo processado
+    # Sentenças com checksum *hh errado/ausente ou número de campos errado ficam em df_quarentena (com o offset no arquivo)
+    (df_pnori,df_pnors,df_pnorw,df_pnore,df_pnorc,df_pnorwb,df_pnorb,df_pnorf,df_datalogger,df_quarentena,) = organizar_String_adcp(input_file,parameter_columns_PNORC,parameter_columns_PNORI,parameter_columns_PNORS,parameter_columns_PNORB,parameter_columns_PNORW,parameter_columns,retornar_quarentena=True,caminho_indice=input_file + ".indice")
+    return {"df_pnori": df_pnori,"df_pnors": df_pnors,"df_pnorw": df_pnorw,"df_pnore": df_pnore,"df_pnorc": df_pnorc,"df_pnorwb": df_pnorwb,"df_pnorb": df_pnorb,"df_pnorf": df_pnorf,"df_datalogger": df_datalogger,"df_quarentena": df_quarentena,    }
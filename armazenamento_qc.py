@@ -0,0 +1,187 @@
+import os
+import json
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# Armazenamento local do QC já processado (dados + Flag_ e tabela de resultados), em Parquet:
+#   raiz/dados/RegistroID=<id>/tipo_sensor=<tipo>/dia=<AAAA-MM-DD>/dados.parquet
+#   raiz/resultados/RegistroID=<id>/tipo_sensor=<tipo>/resultados.parquet
+#   raiz/gaps/RegistroID=<id>/tipo_sensor=<tipo>/gaps.parquet  -> trechos sem dado (df.attrs["gaps"])
+#   raiz/manifesto.json  -> intervalos de tempo já processados por sensor
+# Os dashboards leem daqui filtrando por tempo em vez de rodar o pipeline de novo.
+
+NOME_MANIFESTO = "manifesto.json"
+
+def _pasta_sensor(raiz, tabela, registro_id, tipo_sensor):
+    return os.path.join(raiz, tabela, f"RegistroID={registro_id}", f"tipo_sensor={tipo_sensor}")
+
+def _gravar_parquet(df, arquivo):
+    # grava num temporário e troca, para um leitor nunca ver o arquivo pela metade
+    os.makedirs(os.path.dirname(arquivo), exist_ok=True)
+    temporario = arquivo + ".tmp"
+    df.to_parquet(temporario, index=False)
+    os.replace(temporario, arquivo)
+
+def gravar_qc(raiz, registro_id, tipo_sensor, df, resultados=None, coluna_tempo="GMT-03:00"):
+    """
+    Acrescenta o df do QC ao armazenamento. Só os dias presentes no df são reescritos:
+    as linhas novas se juntam às já gravadas no dia e, no mesmo timestamp, a nova prevalece
+    (serve tanto para a saída completa de processar_sensor quanto para o df_final do modo incremental).
+    Os trechos sem dado de df.attrs["gaps"] vão para a tabela de gaps do sensor.
+    """
+    gaps = df.attrs.get("gaps")
+    df = df.copy()
+    df.attrs = {}  # o Parquet grava attrs em JSON e os Timestamp dos gaps não são serializáveis
+    df[coluna_tempo] = pd.to_datetime(df[coluna_tempo], errors="coerce")
+    df = df[df[coluna_tempo].notna()]
+    if df.empty:
+        return
+    pasta = _pasta_sensor(raiz, "dados", registro_id, tipo_sensor)
+    for dia, df_dia in df.groupby(df[coluna_tempo].dt.strftime("%Y-%m-%d")):
+        arquivo = os.path.join(pasta, f"dia={dia}", "dados.parquet")
+        if os.path.exists(arquivo):
+            df_dia = pd.concat([pd.read_parquet(arquivo), df_dia], ignore_index=True)
+            df_dia = df_dia.drop_duplicates(subset=coluna_tempo, keep="last")
+        _gravar_parquet(df_dia.sort_values(coluna_tempo), arquivo)
+
+    if resultados is not None:
+        resultados = resultados.copy()
+        resultados.attrs = {}
+        resultados = resultados.assign(**{"Processado Em": pd.Timestamp.now(),
+                                          "Inicio": df[coluna_tempo].min(),
+                                          "Fim": df[coluna_tempo].max()})
+        arquivo = os.path.join(_pasta_sensor(raiz, "resultados", registro_id, tipo_sensor), "resultados.parquet")
+        if os.path.exists(arquivo):
+            resultados = pd.concat([pd.read_parquet(arquivo), resultados], ignore_index=True)
+        _gravar_parquet(resultados, arquivo)
+
+    if gaps is not None:
+        gravar_gaps(raiz, registro_id, tipo_sensor, gaps, df[coluna_tempo].min(), df[coluna_tempo].max())
+
+    registrar_intervalo(raiz, registro_id, tipo_sensor, df[coluna_tempo].min(), df[coluna_tempo].max())
+
+def ler_qc(raiz, registro_id, tipo_sensor, inicio=None, fim=None, colunas=None, coluna_tempo="GMT-03:00"):
+    """
+    Lê o df do QC entre inicio e fim (inclusive). O filtro vai para o Parquet:
+    dias fora do intervalo nem são abertos e, dentro deles, só os row groups que cruzam o intervalo.
+    """
+    pasta = _pasta_sensor(raiz, "dados", registro_id, tipo_sensor)
+    if not os.path.isdir(pasta):
+        return pd.DataFrame()
+    particao = ds.partitioning(pa.schema([("dia", pa.string())]), flavor="hive")
+    dataset = ds.dataset(pasta, format="parquet", partitioning=particao)
+    # dias diferentes podem ter colunas diferentes (parâmetro novo no sensor)
+    esquema = pa.unify_schemas([fragmento.physical_schema for fragmento in dataset.get_fragments()])
+    esquema = esquema.append(pa.field("dia", pa.string()))
+    dataset = ds.dataset(pasta, format="parquet", partitioning=particao, schema=esquema)
+
+    filtro = None
+    if inicio is not None:
+        inicio = pd.Timestamp(inicio)
+        filtro = (ds.field("dia") >= inicio.strftime("%Y-%m-%d")) & (ds.field(coluna_tempo) >= inicio)
+    if fim is not None:
+        fim = pd.Timestamp(fim)
+        condicao = (ds.field("dia") <= fim.strftime("%Y-%m-%d")) & (ds.field(coluna_tempo) <= fim)
+        filtro = condicao if filtro is None else filtro & condicao
+    if colunas is not None:
+        colunas = [coluna_tempo] + [c for c in colunas if c != coluna_tempo and c in esquema.names]
+    df = dataset.to_table(columns=colunas, filter=filtro).to_pandas()
+    df = df.drop(columns="dia", errors="ignore").sort_values(coluna_tempo).reset_index(drop=True)
+    df.attrs["gaps"] = ler_gaps(raiz, registro_id, tipo_sensor, inicio, fim)
+    return df
+
+def ler_resultados(raiz, registro_id, tipo_sensor, todos=False):
+    """Tabela de resultados do último processamento gravado (todos=True devolve o histórico)."""
+    arquivo = os.path.join(_pasta_sensor(raiz, "resultados", registro_id, tipo_sensor), "resultados.parquet")
+    if not os.path.exists(arquivo):
+        return pd.DataFrame()
+    resultados = pd.read_parquet(arquivo)
+    if not todos and not resultados.empty:
+        resultados = resultados[resultados["Processado Em"] == resultados["Processado Em"].max()]
+    return resultados.reset_index(drop=True)
+
+#%% GAPS
+def _arquivo_gaps(raiz, registro_id, tipo_sensor):
+    return os.path.join(_pasta_sensor(raiz, "gaps", registro_id, tipo_sensor), "gaps.parquet")
+
+def gravar_gaps(raiz, registro_id, tipo_sensor, gaps, inicio, fim):
+    """
+    Trechos sem dado (registros de df.attrs["gaps"]) do período [inicio, fim] processado: os já gravados
+    que começam dentro do período são trocados pelos novos, os de fora ficam.
+    """
+    arquivo = _arquivo_gaps(raiz, registro_id, tipo_sensor)
+    novos = pd.DataFrame(gaps, columns=["Inicio", "Fim", "Amostras", "Duracao (min)"])
+    if os.path.exists(arquivo):
+        gravados = pd.read_parquet(arquivo)
+        fora = (gravados["Inicio"] < pd.Timestamp(inicio)) | (gravados["Inicio"] > pd.Timestamp(fim))
+        novos = pd.concat([gravados[fora], novos], ignore_index=True) if not novos.empty else gravados[fora]
+    _gravar_parquet(novos.sort_values("Inicio"), arquivo)
+
+def ler_gaps(raiz, registro_id, tipo_sensor, inicio=None, fim=None):
+    """Registros (lista de dicts, como df.attrs["gaps"]) dos trechos sem dado que cruzam [inicio, fim]."""
+    arquivo = _arquivo_gaps(raiz, registro_id, tipo_sensor)
+    if not os.path.exists(arquivo):
+        return []
+    gaps = pd.read_parquet(arquivo)
+    if inicio is not None:
+        gaps = gaps[gaps["Fim"] >= pd.Timestamp(inicio)]
+    if fim is not None:
+        gaps = gaps[gaps["Inicio"] <= pd.Timestamp(fim)]
+    return gaps.to_dict("records")
+
+#%% MANIFESTO
+def ler_manifesto(raiz):
+    arquivo = os.path.join(raiz, NOME_MANIFESTO)
+    if not os.path.exists(arquivo):
+        return {}
+    with open(arquivo, "r") as f:
+        return json.load(f)
+
+def registrar_intervalo(raiz, registro_id, tipo_sensor, inicio, fim):
+    """Junta [inicio, fim] aos intervalos processados do sensor, fundindo os que se sobrepõem."""
+    manifesto = ler_manifesto(raiz)
+    chave = f"{registro_id}/{tipo_sensor}"
+    intervalos = [(pd.Timestamp(a), pd.Timestamp(b)) for a, b in manifesto.get(chave, {}).get("intervalos", [])]
+    intervalos.append((pd.Timestamp(inicio), pd.Timestamp(fim)))
+    fundidos = []
+    for a, b in sorted(intervalos):
+        if fundidos and a <= fundidos[-1][1]:
+            fundidos[-1] = (fundidos[-1][0], max(fundidos[-1][1], b))
+        else:
+            fundidos.append((a, b))
+    manifesto[chave] = {
+        "intervalos": [[a.isoformat(), b.isoformat()] for a, b in fundidos],
+        "atualizado_em": pd.Timestamp.now().isoformat(),
+    }
+    os.makedirs(raiz, exist_ok=True)
+    temporario = os.path.join(raiz, NOME_MANIFESTO + ".tmp")
+    with open(temporario, "w") as f:
+        json.dump(manifesto, f, indent=2)
+    os.replace(temporario, os.path.join(raiz, NOME_MANIFESTO))
+
+def intervalos_processados(raiz, registro_id, tipo_sensor):
+    """Lista de (inicio, fim) já gravados para o sensor."""
+    intervalos = ler_manifesto(raiz).get(f"{registro_id}/{tipo_sensor}", {}).get("intervalos", [])
+    return [(pd.Timestamp(a), pd.Timestamp(b)) for a, b in intervalos]
+
+def atraso_fonte(raiz, registro_id, tipo_sensor):
+    """
+    Atraso da fonte na última gravação: quanto o último dado gravado estava atrás do momento em que
+    foi gravado (Timedelta), ou None se o sensor ainda não tem nada no manifesto.
+    """
+    registro = ler_manifesto(raiz).get(f"{registro_id}/{tipo_sensor}", {})
+    if not registro.get("intervalos"):
+        return None
+    ultimo_dado = max(pd.Timestamp(b) for _, b in registro["intervalos"])
+    return max(pd.Timestamp(registro["atualizado_em"]) - ultimo_dado, pd.Timedelta(0))
+
+def periodo_processado(raiz, registro_id, tipo_sensor, inicio=None, fim=None):
+    """True se algum intervalo do manifesto cobre [inicio, fim] (sem limites: se há qualquer dado)."""
+    intervalos = intervalos_processados(raiz, registro_id, tipo_sensor)
+    if inicio is None and fim is None:
+        return bool(intervalos)
+    for a, b in intervalos:
+        if (inicio is None or a <= pd.Timestamp(inicio)) and (fim is None or pd.Timestamp(fim) <= b):
+            return True
+    return False
@@ -0,0 +1,264 @@
+import argparse
+import contextlib
+import functools
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import QC_FLAGS_UMISAN as qc
+
+# Benchmark do QC com séries sintéticas: gera dados de cada tipo de sensor dentro das faixas do
+# dicionarios.json, injeta spikes, platôs e gaps conhecidos, roda aplicar_filtros e mede tempo por
+# teste, linhas/s, pico de memória e recall das flags sobre as anomalias injetadas.
+
+PARAMETROS_DIRECIONAIS = ['DirTp','DirTp_sea','DirTp_swell','Main_Direction','Main_Direction_sea',
+                          'Main_Direction_swell','Direction','Wind Direction(*)','Heading','Pitch','Roll']
+FREQUENCIAS = {"METEOROLOGIA": 10, "MARE": 5, "ONDAS": 30, "ONDAS_NAO_DIRECIONAIS": 30, "CORRENTES": 10}
+# Período do ciclo dominante de cada sensor, em horas (diurno / maré M2)
+PERIODOS = {"METEOROLOGIA": 24, "MARE": 12.42, "ONDAS": 24, "ONDAS_NAO_DIRECIONAIS": 12.42, "CORRENTES": 12.42}
+DICT_OFFSET = {"GMT-03:00": {"limite_futuro_segundos": 600, "limite_passado_segundos": 86400}}
+ALERT_WINDOW_SIZE = 100
+COLUNA_TEMPO = "GMT-03:00"
+
+def _direcional(coluna):
+    return coluna in PARAMETROS_DIRECIONAIS or coluna.startswith("Direction_Cell")
+
+def _numero_celula(coluna):
+    return int(coluna.split("#")[1]) if "#" in coluna else 0
+
+def _serie(rng, n, passo_horas, limites, periodo_horas, direcional):
+    """Ciclo + ruído vermelho dentro da faixa ambiental; direções como passeio aleatório em 0-360."""
+    if direcional:
+        return (180 + rng.normal(0, 2, n).cumsum()) % 360
+    centro = (limites["ambiental_min"] + limites["ambiental_max"]) / 2
+    escala = (limites["ambiental_max"] - limites["ambiental_min"]) / 4
+    ciclo = np.sin(2 * np.pi * np.arange(n) * passo_horas / periodo_horas + rng.uniform(0, 2 * np.pi))
+    ruido = pd.Series(rng.normal(0, 1, n)).ewm(alpha=0.1).mean().to_numpy()
+    return centro + escala * (0.7 * ciclo + 0.3 * ruido / max(ruido.std(), 1e-9))
+
+def gerar_serie_sintetica(tipo_sensor, n_linhas, limiares, seed=0, inicio="2025-01-01"):
+    """df com GMT-03:00 + uma coluna por parâmetro com limiares de range check."""
+    rng = np.random.default_rng(seed)
+    frequencia = FREQUENCIAS[tipo_sensor]
+    tempos = pd.date_range(inicio, periods=n_linhas, freq=f"{frequencia}min")
+    dados = {COLUNA_TEMPO: tempos}
+    for coluna, limites in limiares["limites_range_check"].items():
+        dados[coluna] = _serie(rng, n_linhas, frequencia / 60, limites, PERIODOS[tipo_sensor], _direcional(coluna))
+        if coluna.startswith("Amplitude_Cell"):
+            dados[coluna] = dados[coluna] - 2 * _numero_celula(coluna)  # sinal cai com a distância
+    df = pd.DataFrame(dados)
+
+    # Relações físicas que os testes de consistência (F13/F14/F15) esperam
+    if tipo_sensor == "METEOROLOGIA":
+        df["Gust Speed(m/s)"] = df["Wind Speed(m/s)"] * 1.3 + 0.5
+        df["Temperature"] = df["Temperature(*C)"]
+        df["Dew Point"] = df["Temperature"] - 3
+    hs, hmax = qc.COLUNAS_ALTURA.get(tipo_sensor, (None, None))
+    if hs is not None:
+        if hs not in df.columns:
+            df[hs] = _serie(rng, n_linhas, frequencia / 60, {"ambiental_min": 0, "ambiental_max": 4},
+                            PERIODOS[tipo_sensor], False)
+        df[hmax] = df[hs] * 1.6
+    return df
+
+def injetar_anomalias(df, limiares, n_eventos, seed=0):
+    """
+    Injeta n_eventos anomalias conhecidas, uma por trecho da série (sem sobreposição):
+    spike (valor muito fora da faixa), platô (valor travado por mais que o 'fail' do F10)
+    e gap (linhas removidas). Devolve (df, anomalias) com os tempos de cada anomalia.
+    """
+    rng = np.random.default_rng(seed + 1)
+    df = df.copy()
+    faixas = limiares["limites_range_check"]
+    repeticao = limiares["limite_repeticao_dados"]
+    colunas = [c for c in faixas if c in df.columns and not _direcional(c)]
+    trecho = len(df) // max(n_eventos, 1)
+    anomalias = []
+    remover = []
+    for evento in range(n_eventos):
+        tipo = ("spike", "plato", "gap")[evento % 3]
+        coluna = colunas[rng.integers(len(colunas))]
+        inicio = evento * trecho
+        if tipo == "spike":
+            linha = inicio + rng.integers(1, trecho - 1)
+            df.iloc[linha, df.columns.get_loc(coluna)] += 4 * (faixas[coluna]["sensores_max"] - faixas[coluna]["sensores_min"]) + 1
+            anomalias.append({"anomalia": "spike", "coluna": coluna, "tempos": df[COLUNA_TEMPO].iloc[[linha]]})
+        elif tipo == "plato":
+            tamanho = repeticao.get(coluna, {}).get("fail", 0) + 5
+            if coluna not in repeticao or tamanho >= trecho - 2:
+                continue
+            linhas = np.arange(inicio + 1, inicio + 1 + tamanho)
+            df.iloc[linhas, df.columns.get_loc(coluna)] = df[coluna].iloc[linhas[0]]
+            anomalias.append({"anomalia": "plato", "coluna": coluna, "tempos": df[COLUNA_TEMPO].iloc[linhas]})
+        else:
+            linhas = np.arange(inicio + 1, inicio + 1 + min(6, trecho - 2))
+            remover.extend(linhas)
+            anomalias.append({"anomalia": "gap", "coluna": None, "tempos": df[COLUNA_TEMPO].iloc[linhas]})
+    df = df.drop(index=df.index[remover]).reset_index(drop=True)
+    return df, anomalias
+
+def recall_anomalias(df_qc, anomalias, parameter_columns):
+    """Fração das células injetadas (linha x coluna) que saíram com flag > 0, por tipo de anomalia."""
+    flags = df_qc.set_index(pd.to_datetime(df_qc[COLUNA_TEMPO]))
+    contagem = {}
+    for anomalia in anomalias:
+        colunas = [anomalia["coluna"]] if anomalia["coluna"] else [c for c in parameter_columns if c != COLUNA_TEMPO]
+        tempos = pd.DatetimeIndex(anomalia["tempos"])
+        presentes = tempos[tempos.isin(flags.index)]
+        injetadas, detectadas = contagem.get(anomalia["anomalia"], (0, 0))
+        injetadas += len(tempos) * len(colunas)
+        for coluna in colunas:
+            detectadas += int((flags.loc[presentes, f"Flag_{coluna}"].to_numpy() > 0).sum())
+        contagem[anomalia["anomalia"]] = (injetadas, detectadas)
+    return [{"Anomalia": nome, "Injetadas": injetadas, "Detectadas": detectadas,
+             "Recall": detectadas / injetadas if injetadas else np.nan}
+            for nome, (injetadas, detectadas) in contagem.items()]
+
+@contextlib.contextmanager
+def cronometrar_testes(tempos):
+    """Soma em 'tempos' o tempo de cada teste do registro enquanto o bloco roda (não vale em modo processos)."""
+    originais = {codigo: teste["funcao"] for codigo, teste in qc.REGISTRO_TESTES.items()}
+
+    def cronometrado(codigo, funcao):
+        # wraps: o ExecutorQC rotula os resultados com funcao.__name__
+        @functools.wraps(funcao)
+        def executar(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                tempos[codigo] = tempos.get(codigo, 0.0) + time.perf_counter() - t0
+        return executar
+
+    for codigo, funcao in originais.items():
+        qc.REGISTRO_TESTES[codigo]["funcao"] = cronometrado(codigo, funcao)
+    try:
+        yield tempos
+    finally:
+        for codigo, funcao in originais.items():
+            qc.REGISTRO_TESTES[codigo]["funcao"] = funcao
+
+def rodar_qc(df, limiares, tipo_sensor, modo_execucao="sequencial", n_workers=None):
+    parameter_columns = [COLUNA_TEMPO] + [c for c in df.columns if c != COLUNA_TEMPO]
+    filtros_ativos = {codigo: True for codigo in qc.REGISTRO_TESTES}
+    with contextlib.redirect_stdout(io.StringIO()):
+        return qc.aplicar_filtros(df.copy(), parameter_columns, DICT_OFFSET, limiares["limites_range_check"],
+                                  limiares["dict_max_min_test"], limiares["st_time_series_dict"],
+                                  limiares["limite_repeticao_dados"], limiares["limite_sigma_aceitavel_and_dict_delta_site"],
+                                  FREQUENCIAS[tipo_sensor], COLUNA_TEMPO, ALERT_WINDOW_SIZE, limiares["dict_spike"],
+                                  limiares["dict_lt_time_and_regressao"], filtros_ativos, tipo_sensor,
+                                  PARAMETROS_DIRECIONAIS + [c for c in df.columns if c.startswith("Direction_Cell")],
+                                  limiares.get("threshold_plato"), limiares.get("threshold_mudanca_abrupta"),
+                                  modo_execucao=modo_execucao, n_workers=n_workers)
+
+def benchmark(tipo_sensor, n_linhas, caminho_dicionarios="dicionarios.json", numero_de_celulas=14,
+              n_eventos=30, repeticoes=3, modo_execucao="sequencial", n_workers=None, seed=0):
+    """
+    Roda o benchmark de um tipo de sensor e devolve (df_tempos, df_recall).
+    df_tempos: uma linha por teste + 'TOTAL' (melhor de 'repeticoes' rodadas), com linhas/s;
+    o pico de memória (tracemalloc) vem de uma rodada extra, para não pesar no tempo.
+    """
+    limiares = qc.carregar_perfil_limiares(caminho_dicionarios, tipo_sensor, numero_de_celulas)
+    df = gerar_serie_sintetica(tipo_sensor, n_linhas, limiares, seed)
+    df, anomalias = injetar_anomalias(df, limiares, n_eventos, seed)
+
+    melhor_total, melhores = np.inf, {}
+    for _ in range(repeticoes):
+        tempos = {}
+        t0 = time.perf_counter()
+        if modo_execucao == "processos":
+            df_qc, _ = rodar_qc(df, limiares, tipo_sensor, modo_execucao, n_workers)
+        else:
+            with cronometrar_testes(tempos):
+                df_qc, _ = rodar_qc(df, limiares, tipo_sensor, modo_execucao, n_workers)
+        total = time.perf_counter() - t0
+        melhor_total = min(melhor_total, total)
+        for codigo, segundos in tempos.items():
+            melhores[codigo] = min(melhores.get(codigo, np.inf), segundos)
+
+    tracemalloc.start()
+    rodar_qc(df, limiares, tipo_sensor, modo_execucao, n_workers)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    linhas = [{"Teste": codigo, "Tempo (s)": segundos} for codigo, segundos in melhores.items()]
+    linhas.append({"Teste": "TOTAL", "Tempo (s)": melhor_total, "Pico Memoria (MB)": pico / 2**20})
+    df_tempos = pd.DataFrame(linhas)
+    df_tempos["Linhas/s"] = len(df) / df_tempos["Tempo (s)"]
+    df_tempos.insert(0, "Linhas", len(df))
+    df_tempos.insert(0, "tipo_sensor", tipo_sensor)
+
+    parameter_columns = [COLUNA_TEMPO] + [c for c in df.columns if c != COLUNA_TEMPO]
+    df_recall = pd.DataFrame(recall_anomalias(df_qc, anomalias, parameter_columns))
+    df_recall.insert(0, "Linhas", len(df))
+    df_recall.insert(0, "tipo_sensor", tipo_sensor)
+    return df_tempos, df_recall
+
+def comparar_com_referencia(df_tempos, df_recall, caminho_referencia, tolerancia):
+    """Regressões contra um benchmark salvo: TOTAL mais lento que a tolerância ou recall menor."""
+    referencia = pd.read_csv(caminho_referencia)
+    regressoes = []
+    atual = pd.concat([df_tempos[df_tempos["Teste"] == "TOTAL"].assign(Anomalia=None), df_recall], ignore_index=True)
+    for _, linha in atual.iterrows():
+        mesma = referencia[(referencia["tipo_sensor"] == linha["tipo_sensor"]) & (referencia["Linhas"] == linha["Linhas"])]
+        if pd.isna(linha["Anomalia"]):
+            mesma = mesma[mesma["Teste"] == "TOTAL"]
+            if len(mesma) and linha["Linhas/s"] < mesma["Linhas/s"].iloc[0] * (1 - tolerancia):
+                regressoes.append(f'{linha["tipo_sensor"]} ({linha["Linhas"]} linhas): '
+                                  f'{linha["Linhas/s"]:.0f} linhas/s contra {mesma["Linhas/s"].iloc[0]:.0f}')
+        else:
+            mesma = mesma[mesma["Anomalia"] == linha["Anomalia"]]
+            if len(mesma) and linha["Recall"] < mesma["Recall"].iloc[0]:
+                regressoes.append(f'{linha["tipo_sensor"]} ({linha["Linhas"]} linhas): recall de {linha["Anomalia"]} '
+                                  f'{linha["Recall"]:.3f} contra {mesma["Recall"].iloc[0]:.3f}')
+    return regressoes
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do QC com séries sintéticas")
+    parser.add_argument("--tipos", nargs="+", default=list(FREQUENCIAS))
+    parser.add_argument("--linhas", nargs="+", type=int, default=[10000])
+    parser.add_argument("--celulas", type=int, default=14)
+    parser.add_argument("--eventos", type=int, default=30)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--modo", default="sequencial", choices=qc.ExecutorQC.MODOS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--dicionarios", default="dicionarios.json")
+    parser.add_argument("--saida", help="CSV com tempos e recall (serve de referência para a próxima rodada)")
+    parser.add_argument("--referencia", help="CSV de uma rodada anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="queda aceitável de linhas/s (fração)")
+    parser.add_argument("--alertas", help="arquivo para os alertas do QC (padrão: diretório temporário, descartado)")
+    args = parser.parse_args()
+    # as séries sintéticas geram milhares de alertas URGENTE; não devem ir para o alertas.log do diretório atual
+    with tempfile.TemporaryDirectory() as pasta_temporaria:
+        qc.ARQUIVO_ALERTAS = args.alertas or os.path.join(pasta_temporaria, "alertas.log")
+        os.environ["QC_ARQUIVO_ALERTAS"] = qc.ARQUIVO_ALERTAS  # workers do modo processos reimportam o módulo
+        executar(args)
+
+def executar(args):
+    todos_tempos, todos_recall = [], []
+    for tipo_sensor in args.tipos:
+        for n_linhas in args.linhas:
+            df_tempos, df_recall = benchmark(tipo_sensor, n_linhas, args.dicionarios, args.celulas, args.eventos,
+                                             args.repeticoes, args.modo, args.workers)
+            todos_tempos.append(df_tempos)
+            todos_recall.append(df_recall)
+    df_tempos = pd.concat(todos_tempos, ignore_index=True)
+    df_recall = pd.concat(todos_recall, ignore_index=True)
+    print(df_tempos.to_string(index=False, float_format=lambda x: f"{x:.4g}"))
+    print()
+    print(df_recall.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    if args.saida:
+        pd.concat([df_tempos, df_recall], ignore_index=True).to_csv(args.saida, index=False)
+    if args.referencia:
+        regressoes = comparar_com_referencia(df_tempos, df_recall, args.referencia, args.tolerancia)
+        for regressao in regressoes:
+            print("REGRESSAO:", regressao)
+        if regressoes:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# Perfil do ADCP (correntes) como cubo contíguo tempo x célula x variável, com as coordenadas ao lado.
+# Os nomes de coluna "{variavel}_Cell#{n}" da tabela larga só são interpretados uma vez (mapa_celulas);
+# recortes por célula, tempo ou variável são vistas do mesmo cubo, sem copiar a tabela larga.
+
+PADRAO_COLUNA_CELULA = re.compile(r"(?P<variavel>.+)_Cell#(?P<celula>\d+)$")
+
+@lru_cache(maxsize=64)
+def _mapa_celulas(colunas):
+    mapa = {}
+    for coluna in colunas:
+        m = PADRAO_COLUNA_CELULA.match(str(coluna))
+        if m and not str(coluna).startswith("Flag_"):
+            mapa.setdefault(m.group("variavel"), {})[int(m.group("celula"))] = coluna
+    return {variavel: dict(sorted(celulas.items())) for variavel, celulas in mapa.items()}
+
+def mapa_celulas(colunas):
+    """{variavel: {numero_celula: coluna}} das colunas _Cell#N (sem as Flag_), células em ordem crescente."""
+    return _mapa_celulas(tuple(colunas))
+
+class PerfilADCP:
+    """
+    valores: cubo float (tempo x célula x variável); flags: cubo uint8 de mesma forma ou None.
+    tempos, celulas e variaveis são as coordenadas de cada eixo. sel() recorta por coordenada e devolve
+    outro PerfilADCP que compartilha a memória do original.
+    """
+    def __init__(self, valores, tempos, celulas, variaveis, flags=None):
+        self.valores = valores
+        self.tempos = pd.DatetimeIndex(tempos).as_unit("ns")
+        self.celulas = np.asarray(celulas)
+        self.variaveis = list(variaveis)
+        self.flags = flags
+
+    def __repr__(self):
+        return (f"PerfilADCP({len(self.tempos)} tempos x {len(self.celulas)} células x "
+                f"{len(self.variaveis)} variáveis: {self.variaveis})")
+
+    @property
+    def shape(self):
+        return self.valores.shape
+
+    @classmethod
+    def de_wide(cls, df, coluna_tempo="GMT-03:00", variaveis=None):
+        """Monta o perfil a partir da tabela larga (colunas {variavel}_Cell#{n} e, se houver, Flag_ de cada uma)."""
+        mapa = mapa_celulas(df.columns)
+        variaveis = [v for v in (variaveis or mapa) if v in mapa]
+        celulas = sorted({celula for v in variaveis for celula in mapa[v]})
+        posicao_celula = {celula: k for k, celula in enumerate(celulas)}
+        valores = np.full((len(df), len(celulas), len(variaveis)), np.nan)
+        flags = None
+        for j, variavel in enumerate(variaveis):
+            for celula, coluna in mapa[variavel].items():
+                k = posicao_celula[celula]
+                valores[:, k, j] = pd.to_numeric(df[coluna], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+                coluna_flag = f"Flag_{coluna}"
+                if coluna_flag in df.columns:
+                    if flags is None:
+                        flags = np.zeros(valores.shape, dtype=np.uint8)
+                    flags[:, k, j] = pd.to_numeric(df[coluna_flag], errors="coerce").fillna(0).to_numpy()
+        tempos = pd.to_datetime(df[coluna_tempo], errors="coerce") if coluna_tempo in df.columns else df.index
+        return cls(valores, tempos, celulas, variaveis, flags)
+
+    @classmethod
+    def de_cubo(cls, tempos, celulas, variaveis, cubo):
+        """A partir da saída de QC_FLAGS_UMISAN.cubo_celulas (cubo ensemble x variável x célula)."""
+        return cls(np.ascontiguousarray(cubo.transpose(0, 2, 1)), tempos, celulas, variaveis)
+
+    def _fatia(self, coordenadas, recorte):
+        if recorte is None:
+            return slice(None)
+        if isinstance(recorte, slice):
+            inicio = 0 if recorte.start is None else np.searchsorted(coordenadas, recorte.start, side="left")
+            fim = len(coordenadas) if recorte.stop is None else np.searchsorted(coordenadas, recorte.stop, side="right")
+            return slice(int(inicio), int(fim))
+        posicao = int(np.searchsorted(coordenadas, recorte))
+        if posicao == len(coordenadas) or coordenadas[posicao] != recorte:
+            raise KeyError(recorte)
+        return slice(posicao, posicao + 1)
+
+    def sel(self, tempo=None, celula=None, variavel=None):
+        """
+        Recorte por coordenada: tempo e celula aceitam um valor ou slice(inicio, fim) com os dois
+        extremos incluídos; variavel aceita um nome ou lista de nomes. Tempo e célula viram vistas.
+        """
+        fatia_tempo = self._fatia(self.tempos.asi8, None if tempo is None else _tempo_ns(tempo))
+        fatia_celula = self._fatia(self.celulas, celula)
+        if variavel is None:
+            indices = slice(None)
+            variaveis = self.variaveis
+        else:
+            variaveis = [variavel] if isinstance(variavel, str) else list(variavel)
+            indices = [self.variaveis.index(v) for v in variaveis]
+            # variáveis consecutivas continuam vista; fora de ordem, numpy copia
+            if indices == list(range(indices[0], indices[0] + len(indices))):
+                indices = slice(indices[0], indices[0] + len(indices))
+        recorte = (fatia_tempo, fatia_celula, indices)
+        return PerfilADCP(self.valores[recorte], self.tempos[fatia_tempo], self.celulas[fatia_celula], variaveis,
+                          None if self.flags is None else self.flags[recorte])
+
+    def variavel(self, nome):
+        """Matriz tempo x célula (vista) de uma variável."""
+        return self.valores[:, :, self.variaveis.index(nome)]
+
+    def flags_variavel(self, nome):
+        if self.flags is None:
+            return np.zeros(self.valores.shape[:2], dtype=np.uint8)
+        return self.flags[:, :, self.variaveis.index(nome)]
+
+    def procurar_variavel(self, prefixo):
+        """Primeira variável cujo nome começa com o prefixo (ex.: 'Speed' -> 'Speed(m/s)')."""
+        for variavel in self.variaveis:
+            if variavel.lower().startswith(prefixo.lower()):
+                return variavel
+        raise KeyError(prefixo)
+
+    def para_wide(self, coluna_tempo="GMT-03:00", com_flags=True):
+        """Tabela larga antiga: coluna de tempo + {variavel}_Cell#{n} (+ Flag_ de cada uma)."""
+        n_tempos, n_celulas, n_variaveis = self.valores.shape
+        nomes = [f"{variavel}_Cell#{celula}" for variavel in self.variaveis for celula in self.celulas]
+        partes = [pd.DataFrame({coluna_tempo: self.tempos}),
+                  pd.DataFrame(self.valores.transpose(0, 2, 1).reshape(n_tempos, n_variaveis * n_celulas), columns=nomes)]
+        if com_flags and self.flags is not None:
+            partes.append(pd.DataFrame(self.flags.transpose(0, 2, 1).reshape(n_tempos, n_variaveis * n_celulas),
+                                       columns=[f"Flag_{nome}" for nome in nomes]))
+        return pd.concat(partes, axis=1)
+
+    def para_long(self):
+        """Formato longo dos heatmaps: Time, Dia, Hora, Cell, Cell_Index, Variavel, Valor (variável, célula, tempo)."""
+        n_tempos, n_celulas, n_variaveis = self.valores.shape
+        tempos = pd.DatetimeIndex(np.tile(self.tempos, n_celulas * n_variaveis))
+        celulas = np.tile(np.repeat(self.celulas, n_tempos), n_variaveis)
+        return pd.DataFrame({
+            "Time": tempos,
+            "Dia": tempos.strftime("%Y-%m-%d"),
+            "Hora": tempos.strftime("%H:%M"),
+            "Cell": [f"Cell#{celula}" for celula in celulas],
+            "Cell_Index": celulas,
+            "Variavel": np.repeat(self.variaveis, n_tempos * n_celulas),
+            "Valor": self.valores.transpose(2, 1, 0).ravel(),
+        })
+
+def _tempo_ns(recorte):
+    """Converte o recorte de tempo (valor ou slice) para inteiros em ns, como tempos.asi8."""
+    if isinstance(recorte, slice):
+        return slice(None if recorte.start is None else pd.Timestamp(recorte.start).as_unit("ns").value,
+                     None if recorte.stop is None else pd.Timestamp(recorte.stop).as_unit("ns").value)
+    return pd.Timestamp(recorte).as_unit("ns").value
@@ -0,0 +1,46 @@
+import json
+import os
+
+import pandas as pd
+
+import armazenamento_qc
+
+def df_qc(inicio, n, gaps):
+    df = pd.DataFrame({"GMT-03:00": pd.date_range(inicio, periods=n, freq="10min"), "Hs": range(n)})
+    df.attrs["gaps"] = gaps
+    return df
+
+def gap(inicio, amostras):
+    inicio = pd.Timestamp(inicio)
+    return {"Inicio": inicio, "Fim": inicio + pd.Timedelta(minutes=10 * (amostras - 1)),
+            "Amostras": amostras, "Duracao (min)": 10 * amostras}
+
+def test_gaps_voltam_na_leitura_do_armazenamento(tmp_path):
+    raiz = str(tmp_path)
+    df = df_qc("2025-01-01", 144, [gap("2025-01-01 03:00", 3)])
+    resultados = pd.DataFrame({"Teste": ["identificar_gaps"], "Falhos": [3]})
+    resultados.attrs["gaps"] = df.attrs["gaps"]  # como aplicar_filtros devolve
+    armazenamento_qc.gravar_qc(raiz, 1, "ONDAS", df, resultados)
+    armazenamento_qc.gravar_qc(raiz, 1, "ONDAS", df_qc("2025-01-02", 144, [gap("2025-01-02 05:00", 2)]))
+    df = armazenamento_qc.ler_qc(raiz, 1, "ONDAS")
+    assert [g["Inicio"] for g in df.attrs["gaps"]] == [pd.Timestamp("2025-01-01 03:00"), pd.Timestamp("2025-01-02 05:00")]
+    # só os trechos do período pedido
+    df = armazenamento_qc.ler_qc(raiz, 1, "ONDAS", inicio="2025-01-02")
+    assert [g["Amostras"] for g in df.attrs["gaps"]] == [2]
+
+def test_reprocessar_periodo_troca_os_gaps_dele(tmp_path):
+    raiz = str(tmp_path)
+    armazenamento_qc.gravar_qc(raiz, 1, "ONDAS", df_qc("2025-01-01", 144, [gap("2025-01-01 03:00", 3)]))
+    armazenamento_qc.gravar_qc(raiz, 1, "ONDAS", df_qc("2025-01-01", 144, []))
+    assert armazenamento_qc.ler_qc(raiz, 1, "ONDAS").attrs["gaps"] == []
+
+def test_atraso_fonte_vem_da_ultima_gravacao(tmp_path):
+    raiz = str(tmp_path)
+    assert armazenamento_qc.atraso_fonte(raiz, 1, "MARE") is None
+    armazenamento_qc.gravar_qc(raiz, 1, "MARE", df_qc("2025-01-01", 6, []))
+    manifesto = armazenamento_qc.ler_manifesto(raiz)
+    manifesto["1/MARE"]["atualizado_em"] = "2025-01-01T03:50:00"
+    with open(os.path.join(raiz, armazenamento_qc.NOME_MANIFESTO), "w") as f:
+        json.dump(manifesto, f)
+    # último dado 00:50, gravado às 03:50: a fonte anda 3 h atrás
+    assert armazenamento_qc.atraso_fonte(raiz, 1, "MARE") == pd.Timedelta(hours=3)
@@ -0,0 +1,21 @@
+import os
+
+import pytest
+
+import benchmark_qc
+import QC_FLAGS_UMISAN as qc
+
+DICIONARIOS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dicionarios.json")
+
+@pytest.mark.parametrize("modo", ["sequencial", "threads"])
+def test_cronometrar_testes_mantem_nome_dos_testes(tmp_path, monkeypatch, modo):
+    monkeypatch.setattr(qc, "ARQUIVO_ALERTAS", str(tmp_path / "alertas.log"))
+    limiares = qc.carregar_perfil_limiares(DICIONARIOS, "MARE", 0)
+    df = benchmark_qc.gerar_serie_sintetica("MARE", 500, limiares, 0)
+    tempos = {}
+    with benchmark_qc.cronometrar_testes(tempos):
+        _, resultados = benchmark_qc.rodar_qc(df, limiares, "MARE", modo, 2)
+    testes = set(resultados["Teste"])
+    assert "executar" not in testes
+    assert {"range_check_sensors", "spike_test", "verifica_dados_repetidos"} <= testes
+    assert "F02_range_check_sensors" in tempos
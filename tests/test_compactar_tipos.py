@@ -0,0 +1,16 @@
+import warnings
+
+import pandas as pd
+
+import QC_FLAGS_UMISAN as qc
+
+def test_tempo_em_texto_vira_datetime_ns():
+    df = pd.DataFrame({"GMT-03:00": ["09/22/25 12:00:00", "09/22/25 12:10:00"], "Hs": [1.0, 2.0],
+                       "Date": ["092225", "092225"]})
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        compacto = qc.compactar_tipos(df, ["Hs"])
+    assert compacto["GMT-03:00"].dtype == "datetime64[ns]"
+    assert compacto["GMT-03:00"].iloc[1] == pd.Timestamp("2025-09-22 12:10:00")
+    assert compacto["Hs"].dtype == "float32"
+    assert df["GMT-03:00"].dtype != "datetime64[ns]"  # o df original não muda
@@ -0,0 +1,49 @@
+import functools
+import operator
+
+import pandas as pd
+
+import QC_FLAGS_UMISAN as qc
+from SIG1000_string_config import (parameter_columns_PNORB, parameter_columns_PNORC, parameter_columns_PNORI,
+                                   parameter_columns_PNORS, parameter_columns_PNORW)
+
+PNORS = "PNORS,092225,120000,0,3ED13007,22.5,1500.0,10.0,1.2,-0.5,10.000,18.5,0,0"
+PNORC = "PNORC,092225,120000,1,0.50,0.300,0.0,0.0,0.0,10.0,C,80,81,82,83,90,91,92,93"
+PNORB = "PNORB,092225,120000,1,4,0.02,0.10,0.8,6.0,9.1,130.0,25.0,128.0,0000"
+
+def sentenca(corpo, checksum_errado=False):
+    soma = functools.reduce(operator.xor, corpo.encode(), 0) ^ (1 if checksum_errado else 0)
+    return f"${corpo}*{soma:02X}"
+
+def gravar_dat(caminho, sentencas):
+    linhas = [f'"2025-09-22 12:00:00",{i},12.5,"{texto}"' for i, texto in enumerate(sentencas)]
+    caminho.write_text("\n".join(linhas) + "\n")
+    return str(caminho)
+
+def organizar(caminho):
+    return qc.organizar_String_adcp(caminho, parameter_columns_PNORC, parameter_columns_PNORI, parameter_columns_PNORS,
+                                    parameter_columns_PNORB, parameter_columns_PNORW, [], retornar_quarentena=True)
+
+def test_tipo_com_numero_de_campos_errado_fica_vazio_com_texto_object(tmp_path):
+    caminho = gravar_dat(tmp_path / "campos.dat", [sentenca(PNORS), sentenca(PNORC), sentenca(PNORB + ",9,9")])
+    tabelas = organizar(caminho)
+    df_pnorc, df_pnorb, df_quarentena = tabelas[4], tabelas[6], tabelas[-1]
+    assert df_pnorb.empty
+    assert df_pnorb["Date"].dtype == object and df_pnorb["Time"].dtype == object
+    assert df_quarentena["Tipo"].tolist() == ["$PNORB"]
+    assert df_quarentena["Motivo"].tolist() == ["campos"]
+    assert len(df_pnorc) == 1  # o resto do arquivo continua lido
+
+def test_buffer_vazio_mantem_tipos_das_colunas():
+    df = qc.BufferSentencas(parameter_columns_PNORB).dataframe()
+    assert list(df.columns) == parameter_columns_PNORB
+    assert df["Identifier"].dtype == object and df["Date"].dtype == object
+    assert pd.api.types.is_float_dtype(df["Hm0"])
+
+def test_tipo_todo_com_checksum_errado_vai_para_quarentena(tmp_path):
+    caminho = gravar_dat(tmp_path / "checksum.dat", [sentenca(PNORS), sentenca(PNORC), sentenca(PNORB, checksum_errado=True)])
+    tabelas, _, df_quarentena = qc.ler_sentencas_nmea(caminho, {"$PNORB": parameter_columns_PNORB})
+    assert "$PNORB" not in tabelas
+    assert df_quarentena["Motivo"].tolist() == ["checksum"]
+    df_pnorb = organizar(caminho)[6]
+    assert df_pnorb.empty and "GMT-03:00" in df_pnorb.columns